@@ -1,445 +1,604 @@
-import streamlit as st
-import json
-import time
-import uuid
-from datetime import datetime, date, timedelta
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-# ==========================================
-# 0. 設定區 (絕對不動)
-# ==========================================
-ADMIN_PASSWORD = "sunny"
-SHEET_NAME = "basketball_db" 
-MAX_CAPACITY = 20
-APP_URL = "https://sunny-girls-basketball.streamlit.app" 
-
-# ==========================================
-# 1. 資料庫連線 (絕對不動)
-# ==========================================
-@st.cache_resource
-def get_db_connection():
-    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-    try:
-        creds_dict = st.secrets["gcp_service_account"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        sheet = client.open(SHEET_NAME).sheet1 
-        return sheet
-    except Exception as e:
-        st.error(f"❌ 資料庫連線失敗：{e}")
-        return None
-
-def load_data():
-    sheet = get_db_connection()
-    if not sheet: return {"sessions": {}, "hidden": [], "leaves": {}}
-    try:
-        data_str = sheet.acell('A1').value
-        if not data_str: return {"sessions": {}, "hidden": [], "leaves": {}}
-        data = json.loads(data_str)
-        if "leaves" not in data: data["leaves"] = {}
-        if "sessions" not in data: data["sessions"] = {}
-        if "hidden" not in data: data["hidden"] = []
-        return data
-    except:
-        return {"sessions": {}, "hidden": [], "leaves": {}}
-
-def save_data(data):
-    sheet = get_db_connection()
-    if not sheet: return
-    try:
-        sheet.update_acell('A1', json.dumps(data, ensure_ascii=False))
-    except Exception as e:
-        st.error(f"❌ 資料儲存失敗：{e}")
-
-# ==========================================
-# 2. 功能工具箱 (絕對不動)
-# ==========================================
-def update_player(pid, d, n, im, bb, oc, iv):
-    current_data = load_data()
-    t = next((p for p in current_data["sessions"][d] if p['id']==pid), None)
-    if t: 
-        final_im = False if "友" in n else im
-        new_count = 0 if iv else 1
-        t.update({'name':n,'isMember':final_im,'bringBall':bb,'occupyCourt':oc, 'count': new_count})
-        save_data(current_data)
-        st.session_state.edit_target = None
-        st.toast("✅ 資料已更新")
-        time.sleep(0.5)
-        st.rerun()
-
-def delete_player(pid, d):
-    current_data = load_data()
-    target = next((p for p in current_data["sessions"][d] if p['id'] == pid), None)
-    if target:
-        target_name = target['name']
-        if "友" in target_name:
-            current_data["sessions"][d] = [p for p in current_data["sessions"][d] if p['id'] != pid]
-        else:
-            current_data["sessions"][d] = [
-                p for p in current_data["sessions"][d] 
-                if p['id'] != pid and not (p['name'].startswith(f"{target_name} (友") or p['name'].startswith(f"{target_name} （友") or p['name'] == f"{target_name}之友")
-            ]
-        if st.session_state.edit_target == pid: st.session_state.edit_target = None
-        save_data(current_data)
-        st.toast("🗑️ 已刪除")
-        time.sleep(0.5)
-        st.rerun()
-
-def promote_player(wid, d):
-    current_data = load_data()
-    _players = sorted(current_data["sessions"][d], key=lambda x: x.get('timestamp', 0))
-    _main, _ = [], []
-    _c = 0
-    for _p in _players:
-        if _c + _p.get('count', 1) <= MAX_CAPACITY: _main.append(_p); _c += _p.get('count', 1)
-    w = next((p for p in current_data["sessions"][d] if p['id']==wid), None)
-    tg = next((p for p in reversed(_main) if "友" in p['name'] and next((x for x in current_data["sessions"][d] if x['id']==p['id']), None)), None) 
-    if w and tg:
-       tg_ref = next((p for p in current_data["sessions"][d] if p['id']==tg['id']), None)
-       cutoff = _main[-1]['timestamp']
-       w['timestamp'] = tg_ref['timestamp'] - 1.0
-       tg_ref['timestamp'] = cutoff + 1.0
-       save_data(current_data)
-       st.balloons(); st.toast("🎉 遞補成功！"); time.sleep(2); st.rerun()
-    else: st.error("無可遞補對象")
-
-def render_list(lst, date_key, is_wait=False, can_edit_global=True, is_admin_mode=False):
-    if not lst:
-        if not is_wait: st.markdown("""<div style="text-align: center; padding: 40px; color: #cbd5e1; opacity:0.8;"><div style="font-size: 36px; margin-bottom: 8px;">🏀</div><p style="font-size: 0.85rem; font-weight:500;">場地空蕩蕩...<br>快來當第一位！</p></div>""", unsafe_allow_html=True)
-        return
-    for idx, p in enumerate(lst):
-        is_f = p.get('count', 1) > 0
-        idx_str = f"{idx+1}." if is_f else "🌸"
-        idx_cls = "list-index" if is_f else "list-index-flower"
-        if st.session_state.edit_target == p['id']:
-            with st.container():
-                st.markdown(f"<div class='edit-box'>✏️ 正在編輯：{p['name']}</div>", unsafe_allow_html=True)
-                with st.form(key=f"e_{p['id']}"):
-                    en = st.text_input("姓名 (不可修改)", p['name'], disabled=True)
-                    ec1, ec2, ec3 = st.columns(3)
-                    is_friend = "友" in p['name']
-                    em = ec1.checkbox("⭐晴女", p.get('isMember'), disabled=True)
-                    eb = ec2.checkbox("🏀帶球", p.get('bringBall'), disabled=is_friend)
-                    ec = ec3.checkbox("🚩佔場", p.get('occupyCourt'), disabled=is_friend)
-                    ev = st.checkbox("📣 不打球 (加油團)", p.get('count') == 0, disabled=is_friend)
-                    b1, b2 = st.columns(2)
-                    if b1.form_submit_button("💾 儲存", type="primary"): update_player(p['id'], date_key, en, em, eb, ec, ev)
-                    if b2.form_submit_button("取消"): st.session_state.edit_target = None; st.rerun()
-        else:
-            badges = ""
-            if p.get('count') == 0: badges += "<span class='badge badge-visit'>📣加油團</span>"
-            if p.get('isMember') and "友" not in p['name']: 
-                badges += "<span class='badge badge-sunny'>晴女</span>"
-            if p.get('bringBall'): badges += "<span class='badge badge-ball'>帶球</span>"
-            if p.get('occupyCourt'): badges += "<span class='badge badge-court'>佔場</span>"
-            
-            c_cfg = [7.5, 0.6, 0.6, 1.3] if not (is_admin_mode and is_wait) else [6.0, 1.2, 0.6, 0.6, 1.6]
-            cols = st.columns(c_cfg, gap="small")
-            with cols[0]:
-                st.markdown(f"""<div class="player-row"><span class="{idx_cls}">{idx_str}</span><span class="list-name">{p['name']}</span>{badges}</div>""", unsafe_allow_html=True)
-            b_idx = 1
-            if is_admin_mode and is_wait and p.get('isMember'):
-                with cols[b_idx]:
-                    if st.button("⬆️", key=f"up_{p['id']}"): promote_player(wid=p['id'], d=date_key)
-                b_idx += 1
-            if can_edit_global:
-                if b_idx < len(cols):
-                    if "友" not in p['name']:
-                        with cols[b_idx]:
-                            if st.button("✏️", key=f"be_{p['id']}"): st.session_state.edit_target = p['id']; st.rerun()
-                if b_idx+1 < len(cols):
-                    with cols[b_idx+1]:
-                        with st.popover("❌"):
-                            st.write("確定取消報名嗎？")
-                            if st.button("確認刪除", key=f"conf_del_{p['id']}", type="primary"):
-                                delete_player(pid=p['id'], d=date_key)
-
-# ==========================================
-# 3. 初始化 & CSS (絕對不動)
-# ==========================================
-if 'is_admin' not in st.session_state: st.session_state.is_admin = False
-if 'edit_target' not in st.session_state: st.session_state.edit_target = None
-
-st.set_page_config(page_title="晴女籃球報名", page_icon="☀️", layout="centered") 
-
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+TC:wght@400;500;700;900&display=swap');
-    [data-testid="stAppViewContainer"] { background-color: #f8fafc !important; color: #334155 !important; }
-    html, body, [class*="css"], p, div, label, span, h1, h2, h3, .stMarkdown { font-family: 'Noto Sans TC', sans-serif; color: #334155 !important; }
-    .block-container { padding-top: 4rem !important; padding-bottom: 5rem !important; }
-    header {background: transparent !important;}
-    [data-testid="stDecoration"], [data-testid="stToolbar"], [data-testid="stStatusWidget"], footer, #MainMenu, .stDeployButton {display: none !important;}
-    [data-testid="stSidebarCollapsedControl"] { display: none !important; }
-    .header-box { background: white; padding: 1.5rem 1rem; border-radius: 20px; text-align: center; margin-bottom: 20px; box-shadow: 0 4px 20px rgba(0,0,0,0.03); border: 1px solid #f1f5f9; }
-    .header-title { font-size: 1.6rem; font-weight: 800; color: #1e293b !important; letter-spacing: 1px; margin-bottom: 5px; }
-    .header-sub { font-size: 0.9rem; color: #64748b !important; font-weight: 500; }
-    .info-pill { background: #f1f5f9; padding: 4px 14px; border-radius: 30px; font-size: 0.8rem; font-weight: 600; color: #475569 !important; display: inline-block; margin-top: 10px; }
-    .stTabs [data-baseweb="tab-list"] { gap: 8px; margin-bottom: 10px; }
-    .stTabs [data-baseweb="tab"] { height: 38px; background-color: transparent; border-radius: 20px; padding: 0 16px; font-size: 0.9rem; border: 1px solid transparent; color: #64748b !important; font-weight: 500; }
-    .stTabs [aria-selected="true"] { background-color: white; color: #3b82f6 !important; border: none; box-shadow: 0 2px 6px rgba(0,0,0,0.04); font-weight: 700; }
-    div[data-baseweb="tab-highlight"] { display: none !important; height: 0 !important; }
-    div[data-baseweb="tab-border"] { display: none !important; }
-    .player-row { background: white; border: 1px solid #f1f5f9; border-radius: 12px; padding: 8px 10px; margin-bottom: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.03); display: flex; align-items: center; width: 100%; min-height: 40px; }
-    .list-index { color: #cbd5e1 !important; font-weight: 700; font-size: 0.9rem; margin-right: 12px; min-width: 20px; text-align: right;}
-    .list-index-flower { color: #f472b6 !important; font-weight: 700; font-size: 1rem; margin-right: 12px; min-width: 20px; text-align: right;}
-    .list-name { color: #334155 !important; font-weight: 700; font-size: 1.15rem; flex-grow: 1; line-height: 1.2; }
-    .badge { padding: 2px 6px; border-radius: 5px; font-size: 0.7rem; font-weight: 700; margin-left: 4px; display: inline-block; vertical-align: middle; }
-    .badge-sunny { background: #fffbeb; color: #d97706 !important; }
-    .badge-ball { background: #fff7ed; color: #c2410c !important; }
-    .badge-court { background: #eff6ff; color: #1d4ed8 !important; }
-    .badge-visit { background: #fdf2f8; color: #db2777 !important; border: 1px solid #fce7f3; }
-    .progress-container { width: 100%; background: #e2e8f0; border-radius: 6px; height: 6px; margin-top: 8px; overflow: hidden; }
-    .progress-bar { height: 100%; border-radius: 6px; transition: width 0.6s ease; }
-    .progress-info { display: flex; justify-content: space-between; font-size: 0.8rem; color: #64748b !important; margin-bottom: 2px; font-weight: 600; }
-    .edit-box { border: 1px solid #3b82f6; border-radius: 12px; padding: 12px; background: #eff6ff; margin-bottom: 10px; }
-    
-    .rules-box { background-color: white; border-radius: 16px; padding: 20px; border: 1px solid #f1f5f9; box-shadow: 0 4px 15px rgba(0,0,0,0.02); margin-top: 15px; }
-    .rules-header { font-size: 1rem; font-weight: 800; color: #334155 !important; margin-bottom: 15px; border-bottom: 2px solid #f1f5f9; padding-bottom: 8px; }
-    .rules-row { display: flex; align-items: flex-start; margin-bottom: 12px; }
-    .rules-icon { font-size: 1.1rem; margin-right: 12px; line-height: 1.4; }
-    .rules-content { font-size: 0.9rem; color: #64748b !important; line-height: 1.5; }
-    .rules-content b { color: #475569 !important; font-weight: 700; }
-    .rules-footer { margin-top: 15px; font-size: 0.85rem; color: #94a3b8 !important; text-align: right; font-weight: 500; }
-    
-    button[data-testid="stBaseButton-secondary"] { width: 100% !important; height: 32px !important; padding: 0 !important;}
-    </style>
-""", unsafe_allow_html=True)
-
-# ==========================================
-# 4. 主畫面內容
-# ==========================================
-st.markdown("""<div class="header-box"><div class="header-title">晴女☀️在場邊等妳🌈</div><div class="header-sub">✨ Keep Playing, Keep Shining ✨</div><div class="info-pill">📍 朱崙公園 &nbsp;|&nbsp; 🕒 19:00</div></div>""", unsafe_allow_html=True)
-st.session_state.data = load_data()
-
-# 請假與公報
-c_l1, c_l2 = st.columns(2)
-with c_l1:
-    with st.expander("🏖️ 我要請假 (長假登記)"):
-        with st.form("l_form", clear_on_submit=True):
-            n = st.text_input("姓名")
-            m = st.date_input("請假月份")
-            if st.form_submit_button("送出假單") and n:
-                cur = load_data(); s = m.strftime("%Y-%m")
-                if n not in cur["leaves"]: cur["leaves"][n] = []
-                if s not in cur["leaves"][n]: cur["leaves"][n].append(s); save_data(cur); st.toast("✅ 已登記"); time.sleep(1); st.rerun()
-
-with c_l2:
-    with st.expander("📜 休假公報", expanded=False):
-        l_d = st.session_state.data.get("leaves", {})
-        if any(l_d.values()):
-            comb_l = {}
-            n_map = {}
-            for o_n, mons in l_d.items():
-                low_n = o_n.lower()
-                if low_n not in comb_l:
-                    comb_l[low_n] = set()
-                    n_map[low_n] = o_n
-                comb_l[low_n].update(mons)
-            
-            for low_n in sorted(comb_l.keys()):
-                disp_n = n_map[low_n]
-                m_list = sorted(list(comb_l[low_n]))
-                col_info, col_manage = st.columns([0.82, 0.18])
-                with col_info:
-                    st.markdown(f"**👤 {disp_n}**: {', '.join(m_list)}")
-                with col_manage:
-                    with st.popover("🗑️"):
-                        st.write(f"管理 {disp_n} 的假單：")
-                        for m_item in m_list:
-                            if st.button(f"刪除 {m_item}", key=f"del_final_{low_n}_{m_item}"):
-                                cur = load_data()
-                                for ok in list(cur["leaves"].keys()):
-                                    if ok.lower() == low_n and m_item in cur["leaves"][ok]:
-                                        cur["leaves"][ok].remove(m_item)
-                                        if not cur["leaves"][ok]: del cur["leaves"][ok]
-                                save_data(cur); st.toast(f"🗑️ 已移除 {m_item}"); time.sleep(0.5); st.rerun()
-                        st.divider()
-                        if st.button("🚨 強制刪除此人", key=f"f_dl_{low_n}", type="secondary"):
-                            cur = load_data()
-                            for ok in list(cur["leaves"].keys()):
-                                if ok.lower() == low_n: del cur["leaves"][ok]
-                            save_data(cur); st.toast("🗑️ 已強制移除"); time.sleep(0.5); st.rerun()
-        else: st.info("目前無人請假")
-
-# 場次顯示
-all_d = sorted(st.session_state.data["sessions"].keys())
-h_d = st.session_state.data.get("hidden", [])
-dates = [d for d in all_d if d not in h_d]
-
-if not dates: st.info("👋 目前沒有開放報名的場次")
-else:
-    tabs = st.tabs([f"{int(d.split('-')[1])}/{int(d.split('-')[2])}" for d in dates])
-    for i, dk in enumerate(dates):
-        with tabs[i]:
-            try:
-                dt = datetime.strptime(dk, "%Y-%m-%d")
-                locked = datetime.now() > (dt - timedelta(days=1)).replace(hour=12, minute=0)
-            except: locked = False
-            can_edit = st.session_state.is_admin or (not locked)
-            p_l = sorted(st.session_state.data["sessions"][dk], key=lambda x: x.get('timestamp', 0))
-            main, wait, curr = [], [], 0
-            for p in p_l:
-                if curr + p.get('count', 1) <= MAX_CAPACITY: main.append(p); curr += p.get('count', 1)
-                else: wait.append(p)
-            
-            b_c = len([x for x in main if x.get('bringBall')])
-            c_c = len([x for x in main if x.get('occupyCourt')])
-            pct = min(100, (curr/MAX_CAPACITY)*100)
-            
-            color_code = '#4ade80' if pct < 50 else '#fbbf24' if pct < 85 else '#f87171'
-            p_html = f'<div class="progress-info"><span>正選 ({curr}/{MAX_CAPACITY})</span><span>候補: {len(wait)}</span></div>'
-            b_html = f'<div class="progress-container"><div class="progress-bar" style="width: {pct}%; background: {color_code};"></div></div>'
-            s_html = f'<div style="display: flex; justify-content: flex-end; gap: 15px; font-size: 0.85rem; color: #64748b; margin-bottom: 25px; font-weight: 500; padding-right: 5px;"><span>🏀 帶球：<b>{b_c}</b></span><span>🚩 佔場：<b>{c_c}</b></span></div>'
-            st.markdown(f'<div style="margin-bottom: 5px; padding: 0 4px;">{p_html}{b_html}</div>{s_html}', unsafe_allow_html=True)
-
-            with st.expander("📝 點擊報名 / 規則說明", expanded=not locked):
-                if locked and not st.session_state.is_admin: st.warning("⛔ 已截止報名")
-                with st.form(f"f_{dk}", clear_on_submit=True):
-                    name = st.text_input("球員姓名", disabled=not can_edit)
-                    c1, c2, c3 = st.columns(3)
-                    im = c1.checkbox("⭐晴女", key=f"m_{dk}", disabled=not can_edit)
-                    bb = c2.checkbox("🏀帶球", key=f"b_{dk}", disabled=not can_edit)
-                    oc = c3.checkbox("🚩佔場", key=f"c_{dk}", disabled=not can_edit)
-                    ev = st.checkbox("📣 不打球 (加油團)", key=f"v_{dk}", disabled=not can_edit)
-                    tot = st.number_input("報名人數", 1, 3, 1, key=f"t_{dk}", disabled=not can_edit)
-                    if st.form_submit_button("送出報名", disabled=not can_edit, type="primary"):
-                        if "友" in name:
-                            st.error("❌ 請輸入『團員姓名』並使用下方『報名人數』來幫朋友報名。")
-                        elif name:
-                            lat = load_data(); cur_p = lat["sessions"].get(dk, [])
-                            num_rel = len([x for x in cur_p if name in x['name']])
-                            if num_rel == 0 and not im: st.error("❌ 第一次報名需勾選「⭐晴女」")
-                            elif num_rel > 0 and im: st.error("❌ 加報朋友請勿重複勾選晴女")
-                            elif num_rel + tot > 3: st.error("❌ 每人上限 3 位")
-                            else:
-                                ts = time.time(); new_li = []
-                                for k in range(tot):
-                                    is_m = (k==0 and num_rel == 0)
-                                    fn = name if is_m else f"{name} (友{num_rel+k})"
-                                    new_li.append({"id": str(uuid.uuid4()),"name": fn,"count": (0 if ev and is_m else 1),"isMember": (im if is_m else False),"bringBall": (bb if is_m else False),"occupyCourt": (oc if is_m else False),"timestamp": ts + (k*0.01)})
-                                lat["sessions"][dk].extend(new_li); save_data(lat); st.balloons(); st.toast("🎉 報名成功！"); time.sleep(2); st.rerun()
-
-                st.markdown("""
-                <div class="rules-box">
-                    <div class="rules-header">📌 報名須知</div>
-                    <div class="rules-row"><span class="rules-icon">🔴</span><div class="rules-content"><b>資格與規範</b>：採實名制。僅限 <b>⭐晴女</b> 報名。欲事後補報朋友，請用原名再次填寫即可 (含自己上限3位)。</div></div>
-                    <div class="rules-row"><span class="rules-icon">🟡</span><div class="rules-content"><b>📣加油團</b>：團員若「不打球但帶朋友」請勾此項。本人不佔名額，但朋友會佔打球名額。</div></div>
-                    <div class="rules-row"><span class="rules-icon">🟢</span><div class="rules-content"><b>遞補機制</b>：正選 20 人。候補名單中之 <b>⭐晴女</b>，享有優先遞補「非晴女」之權利。</div></div>
-                    <div class="rules-footer">有任何問題請找最美管理員們 ❤️</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-            st.subheader("🏀 報名名單")
-            render_list(main, dk, False, can_edit, st.session_state.is_admin)
-            if wait:
-                st.markdown("<br>", unsafe_allow_html=True); st.subheader("⏳ 候補名單")
-                render_list(wait, dk, True, can_edit, st.session_state.is_admin)
-
-# ==========================================
-# 5. 管理員專區 (優化報表邏輯)
-# ==========================================
-st.markdown("<br><br><br>", unsafe_allow_html=True); st.divider()
-st.markdown("<div style='text-align: center; color: #cbd5e1; font-size: 0.8rem;'>▼ 管理員專用通道 ▼</div>", unsafe_allow_html=True)
-with st.expander("⚙️ 管理員專區 (Admin)", expanded=st.session_state.is_admin):
-    if not st.session_state.is_admin:
-        if st.text_input("密碼", key="admin_pwd_input", type="password") == ADMIN_PASSWORD: st.session_state.is_admin = True; st.rerun()
-    else:
-        if st.button("登出"): st.session_state.is_admin = False; st.rerun()
-        st.subheader("管理功能")
-        nd = st.date_input("新增日期")
-        if st.button("新增場次"):
-            cur = load_data()
-            if str(nd) not in cur["sessions"]: cur["sessions"][str(nd)] = []; save_data(cur); st.rerun()
-        all_s = sorted(st.session_state.data["sessions"].keys())
-        if all_s:
-            del_s = st.selectbox("刪除場次", all_s)
-            if st.button("確認刪除"):
-                cur = load_data(); del cur["sessions"][del_s]; save_data(cur); st.rerun()
-            h_s = st.multiselect("隱藏場次", all_s, default=st.session_state.data.get("hidden", []))
-            if st.button("更新隱藏"):
-                cur = load_data(); cur["hidden"] = h_s; save_data(cur); st.rerun()
-        
-        st.subheader("出席統計")
-        if st.button("📊 產生報表"):
-            try:
-                d_m = st.session_state.data
-                stats = {} 
-                
-                # 處理場次 (收集出席資料)
-                for ds, pl in d_m["sessions"].items():
-                    do = datetime.strptime(ds, "%Y-%m-%d").date()
-                    if do <= date.today():
-                        for p in pl:
-                            pname = p['name']
-                            if "友" not in pname:
-                                low_n = pname.lower()
-                                if low_n not in stats:
-                                    stats[low_n] = {"name": pname, "last_date": do, "leaves": set(), "attend_count": 1}
-                                else:
-                                    stats[low_n]["attend_count"] += 1
-                                    if do > stats[low_n]["last_date"]:
-                                        stats[low_n]["last_date"] = do
-                                        stats[low_n]["name"] = pname
-                
-                # 處理請假
-                for lname, l_months in d_m["leaves"].items():
-                    low_n = lname.lower()
-                    if low_n not in stats:
-                        stats[low_n] = {"name": lname, "last_date": None, "leaves": set(l_months), "attend_count": 0}
-                    else:
-                        stats[low_n]["leaves"].update(l_months)
-
-                rep = []
-                curr_m = date.today().strftime("%Y-%m")
-                for ln in sorted(stats.keys()):
-                    item = stats[ln]
-                    name = item["name"]
-                    ld = item["last_date"]
-                    l_mons = sorted(list(item["leaves"]))
-                    is_on_leave = curr_m in l_mons
-                    
-                    if ld:
-                        days = (date.today() - ld).days
-                        ld_str = str(ld)
-                    else:
-                        days = 999
-                        ld_str = "無出席紀錄"
-                    
-                    # 智能化狀態判斷
-                    if is_on_leave:
-                        status = "🏖️ 請假中"
-                    elif days > 60:
-                        status = "🔴 逾期 (2個月未出席)"
-                    elif days > 45:
-                        status = "🟡 預警 (本月需出席)"
-                    else:
-                        status = "🟢 活躍"
-                    
-                    # 檢查連續請假月份 (長假限制)
-                    leave_count = len(l_mons)
-                    leave_warning = "⚠️ 超過2月" if leave_count > 2 else "正常"
-
-                    rep.append({
-                        "姓名": name,
-                        "最後出席": ld_str,
-                        "缺席天數": days if ld else "N/A",
-                        "請假月份": ", ".join(l_mons) if l_mons else "無",
-                        "累計請假月數": leave_count,
-                        "狀態": status
-                    })
-                st.table(rep)
-            except:
-                st.error("統計失敗")
-
-        st.divider()
-        if st.button("🧹 一鍵清洗現有錯誤標籤"):
-            cur = load_data()
-            count = 0
-            for dk in cur["sessions"]:
-                for p in cur["sessions"][dk]:
-                    if "友" in p['name'] and p.get('isMember'):
-                        p['isMember'] = False
-                        count += 1
-            save_data(cur); st.success(f"清洗完成！共修正 {count} 筆。"); time.sleep(2); st.rerun()
+import streamlit as st
+import os
+import functools
+import threading
+import time
+from datetime import datetime, date, timedelta
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+import storage
+import codec
+import bulk
+import mutations
+import roster
+import leaves
+import stats
+import writer
+import metrics
+import quota
+from concurrent.futures import TimeoutError as FutureTimeout
+from streamlit.errors import StreamlitAPIException
+
+# ==========================================
+# 0. 設定區 (絕對不動)
+# ==========================================
+ADMIN_PASSWORD = "sunny"
+SHEET_NAME = "basketball_db" 
+MAX_CAPACITY = 20
+APP_URL = "https://sunny-girls-basketball.streamlit.app" 
+DB_BACKEND = os.environ.get("DB_BACKEND", "sheets")  # "sheets" 或本機開發用 "sqlite"
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "basketball.db")
+JOURNAL_PATH = os.environ.get("JOURNAL_PATH", "mutation_journal.jsonl")  # 寫入佇列的本機日誌，重啟時重放
+WRITE_WINDOW = 0.3   # 秒；同一時間窗內的報名合併成一次寫入
+WRITE_TIMEOUT = 10   # 秒；超過就先回畫面，結果下次 rerun 再顯示
+ARCHIVE_AFTER_DAYS = 14  # 超過幾天的場次搬進歸檔 (按月分)，平常不再讀取
+ARCHIVE_RETRY = 600      # 秒；歸檔失敗 (衝突 / 配額) 後隔多久才再試，這段時間內的 rerun 不再碰 Sheets
+LIVE_REFRESH = 10         # 秒；開著的頁面多久檢查一次名單有沒有變 (只查版本號，沒變就不重畫)
+VERSION_CHECK_EVERY = 3   # 秒；整個程序最多多久讀一次版本號 (meta!A2)，所有分頁共用這次結果；有好幾團時按團數放大 (見 get_cache)
+SHEETS_READS_PER_MIN = 60   # Google Sheets 每個帳號每分鐘的讀取 / 寫入上限 (整個程序共用)
+SHEETS_WRITES_PER_MIN = 60
+
+# 多團：網址加 ?g=<代號> 選團，沒帶就是預設團。每團的資料各自一份 (同一本試算表用分頁前綴區分，也可以指定自己的試算表)，
+# 連線、快照快取、寫入佇列、名單快取也都各自一份，某團報名爆量不會擋到別團，也不會讓別團的快取失效。
+# 其他團寫在 secrets 的 [groups.<代號>]，沒寫的欄位沿用預設團；分頁前綴預設 "<代號>_"。
+# 管理員密碼 (password) 不沿用，每團要自己設，沒設的團不能登入管理員
+DEFAULT_GROUP = "sunny"
+GROUPS = {
+    DEFAULT_GROUP: {"name": "晴女", "title": "晴女☀️在場邊等妳🌈", "sheet": SHEET_NAME, "prefix": "", "capacity": MAX_CAPACITY,
+                    "venue": "朱崙公園", "time": "19:00", "password": ADMIN_PASSWORD, "sqlite": SQLITE_PATH, "journal": JOURNAL_PATH},
+}
+
+# ==========================================
+# 1. 資料庫連線 (絕對不動)
+# ==========================================
+def get_groups():
+    groups, base = dict(GROUPS), GROUPS[DEFAULT_GROUP]
+    try: extra = st.secrets.get("groups", {})
+    except FileNotFoundError: extra = {}  # 本機 sqlite 開發可以沒有 secrets.toml
+    for gid, cfg in extra.items():
+        groups[gid] = {**base, "name": gid, "title": gid, "prefix": f"{gid}_", "sqlite": f"basketball_{gid}.db",
+                       "journal": f"mutation_journal_{gid}.jsonl", "password": None, **dict(cfg)}
+    return groups
+
+# Google 的配額是算在服務帳號上的，所有團、所有試算表共用同一組額度
+@st.cache_resource
+def get_quota():
+    return quota.TokenBucket(SHEETS_READS_PER_MIN), quota.TokenBucket(SHEETS_WRITES_PER_MIN)
+
+@st.cache_resource
+def get_spreadsheet(sheet):
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    with metrics.span("sheets.auth"):
+        creds_dict = st.secrets["gcp_service_account"]
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        client = gspread.authorize(creds)
+        ss = metrics.SheetsProbe(client.open(sheet))
+    return quota.Throttled(ss, *get_quota())
+
+# 連線失敗直接丟出去 (cache_resource 不會快取例外)，下一次 rerun 會重新連，不會卡在失敗的狀態
+# 以下資源都按團代號各快取一份
+@st.cache_resource
+def get_db_connection(gid):
+    g = get_groups()[gid]
+    with metrics.span("db.connect", group=gid):
+        if DB_BACKEND == "sqlite": return storage.SQLiteStorage(g["sqlite"])
+        return storage.SheetStorage(get_spreadsheet(g["sheet"]), g["prefix"])
+
+@st.cache_resource
+def get_caches():
+    return {}  # 團代號 -> SnapshotCache，這個程序裡有人開過的團
+
+@st.cache_resource
+def get_cache(gid):
+    c = storage.SnapshotCache(get_db_connection(gid), check_every=VERSION_CHECK_EVERY)
+    caches = get_caches()
+    caches[gid] = c
+    # 每團各自輪詢自己的版本號，但讀取配額是全部共用的：開過的團越多每團查得越疏，
+    # 合計維持在一團時的 60 / VERSION_CHECK_EVERY 次/分，不會把載入 / 存檔要用的讀取額度吃光
+    if DB_BACKEND == "sheets":
+        for x in caches.values(): x.check_every = VERSION_CHECK_EVERY * len(caches)
+    return c
+
+# 回傳的是所有分頁共用的快照，只能讀，寫入一律走 mutate()
+# 讀不到時有舊快照就用舊的 (get_cache(GID).stale 會標記)；連一份都沒有就停在錯誤訊息，絕不拿空資料畫名單
+@metrics.timed("load_data")
+def load_data():
+    try:
+        return get_cache(GID).get()
+    except storage.StorageUnavailable as e:
+        st.error(f"❌ 暫時讀不到報名資料，請稍後重新整理 ({e})")
+    except Exception as e:
+        st.error(f"❌ 資料庫連線失敗：{e}")
+    st.stop()
+
+@st.cache_resource
+def get_rosters(gid):
+    return roster.RosterCache(get_groups()[gid]["capacity"])
+
+@st.cache_resource
+def get_leaves(gid):
+    return leaves.LeaveCache()
+
+@st.cache_resource
+def get_writer(gid):
+    # 寫入佇列只有一個背景執行緒依序 commit，所以可以自己留一份假單索引 / 各場次姓名索引跨批次沿用
+    apply = functools.partial(mutations.apply_all, leaves=leaves.LeaveIndex(), names={})
+    return writer.WriteBehind(get_cache(gid), apply, get_groups()[gid]["journal"], WRITE_WINDOW)
+
+def _result(res):
+    if isinstance(res, mutations.Rejected): st.error(f"❌ {res}"); return None
+    if isinstance(res, storage.StorageUnavailable): st.error(f"⚠️ Google Sheets 忙線中，這次沒有存到，請稍後再試 ({res})"); return None
+    if isinstance(res, Exception): st.error(f"❌ 資料儲存失敗：{res}"); return None
+    return res
+
+# 送出一筆異動 (見 mutations.py) 到寫入佇列並等它落地；失敗時顯示錯誤並回傳 None
+def mutate(op, **kw):
+    w = get_writer(GID)
+    try:
+        with metrics.span(f"mutate.{op}"):
+            fut = w.submit(mutations.make(op, **kw))
+            res = fut.result(timeout=WRITE_TIMEOUT)
+        return _result(res)
+    except FutureTimeout:
+        st.session_state.pending.append(fut)
+        st.info("⏳ 已送出，正在寫入中…")
+        return None
+    except Exception as e:
+        return _result(e)
+
+@st.cache_resource
+def get_archive_state(gid):
+    # 同一團同時只讓一個 rerun 去歸檔；失敗記下時間，ARCHIVE_RETRY 秒內其他 rerun 直接跳過
+    return {"lock": threading.Lock(), "failed": 0.0, "error": None}
+
+# 過期場次搬進歸檔：先把出席結算進統計再搬，之後首頁只讀得到近期場次
+# 失敗不影響報名 (場次只是還留在近期資料裡)，所以只提示管理員
+def archive_old_sessions():
+    cutoff = str(date.today() - timedelta(days=ARCHIVE_AFTER_DAYS))
+    sessions = st.session_state.data["sessions"]
+    if not sessions or min(sessions) >= cutoff: return
+    a, today = get_archive_state(GID), str(date.today())
+    if time.time() - a["failed"] >= ARCHIVE_RETRY and a["lock"].acquire(blocking=False):
+        try:
+            get_cache(GID).archive(cutoff, lambda data: stats.rollover(data, today))
+            a["error"] = None
+            st.session_state.data = load_data()
+        except Exception as e:
+            a["failed"], a["error"] = time.time(), e
+            metrics.count("archive.failures")
+        finally:
+            a["lock"].release()
+    e = a["error"]
+    if e and st.session_state.is_admin: st.warning(f"⚠️ 歸檔失敗，{ARCHIVE_RETRY // 60} 分鐘後自動重試：{str(e) or type(e).__name__}")
+
+# 上一輪等太久的異動：完成了就補顯示結果
+def check_pending():
+    left = []
+    for fut in st.session_state.pending:
+        if not fut.done(): left.append(fut); continue
+        if _result(fut.exception() or fut.result()) is not None: st.toast("✅ 已完成寫入")
+    st.session_state.pending = left
+
+# 在 fragment 裡的按鈕只重跑那個 fragment；不在 fragment rerun 中就退回整頁 rerun
+def rerun_fragment():
+    try: st.rerun(scope="fragment")
+    except StreamlitAPIException: st.rerun()
+
+# 取代原本的 sleep 再 rerun：訊息留到下一輪畫面再顯示
+def flash(msg, balloons=False, scope="app"):
+    st.session_state.flash = (msg, balloons)
+    if scope == "fragment": rerun_fragment()
+    st.rerun()
+
+# 批次作業的預覽：先在資料副本上套用，差異存在 session_state 等管理員按確認
+def plan_bulk(label, muts):
+    try: diff, bad = bulk.preview(st.session_state.data, muts)
+    except Exception as e: st.error(f"❌ 無法預覽：{e}"); return
+    st.session_state.bulk_plan = {"label": label, "muts": muts, "diff": diff, "skip": [str(e) for _, e in bad]}
+
+def show_flash():
+    f = st.session_state.pop("flash", None)
+    if f:
+        if f[1]: st.balloons()
+        st.toast(f[0])
+
+# ==========================================
+# 2. 功能工具箱 (絕對不動)
+# ==========================================
+def update_player(pid, d, n, im, bb, oc, iv):
+    if mutate("update_player", d=d, pid=pid, name=n, im=im, bb=bb, oc=oc, iv=iv) is not None:
+        st.session_state.edit_target = None
+        flash("✅ 資料已更新", scope="fragment")
+
+def delete_player(pid, d):
+    if mutate("delete_player", d=d, pid=pid) is not None:
+        if st.session_state.edit_target == pid: st.session_state.edit_target = None
+        flash("🗑️ 已刪除", scope="fragment")
+
+def promote_player(wid, d):
+    if mutate("promote", d=d, wid=wid, cap=G["capacity"]) is not None:
+        flash("🎉 遞補成功！", balloons=True, scope="fragment")
+
+@metrics.timed("render_list")
+def render_list(lst, date_key, is_wait=False, can_edit_global=True, is_admin_mode=False):
+    if not lst:
+        if not is_wait: st.markdown("""<div style="text-align: center; padding: 40px; color: #cbd5e1; opacity:0.8;"><div style="font-size: 36px; margin-bottom: 8px;">🏀</div><p style="font-size: 0.85rem; font-weight:500;">場地空蕩蕩...<br>快來當第一位！</p></div>""", unsafe_allow_html=True)
+        return
+    for idx, p in enumerate(lst):
+        is_f = p.get('count', 1) > 0
+        idx_str = f"{idx+1}." if is_f else "🌸"
+        idx_cls = "list-index" if is_f else "list-index-flower"
+        if st.session_state.edit_target == p['id']:
+            with st.container():
+                st.markdown(f"<div class='edit-box'>✏️ 正在編輯：{p['name']}</div>", unsafe_allow_html=True)
+                with st.form(key=f"e_{p['id']}"):
+                    en = st.text_input("姓名 (不可修改)", p['name'], disabled=True)
+                    ec1, ec2, ec3 = st.columns(3)
+                    is_friend = roster.is_friend(p)
+                    em = ec1.checkbox("⭐晴女", p.get('isMember'), disabled=True)
+                    eb = ec2.checkbox("🏀帶球", p.get('bringBall'), disabled=is_friend)
+                    ec = ec3.checkbox("🚩佔場", p.get('occupyCourt'), disabled=is_friend)
+                    ev = st.checkbox("📣 不打球 (加油團)", p.get('count') == 0, disabled=is_friend)
+                    b1, b2 = st.columns(2)
+                    if b1.form_submit_button("💾 儲存", type="primary"): update_player(p['id'], date_key, en, em, eb, ec, ev)
+                    if b2.form_submit_button("取消"): st.session_state.edit_target = None; rerun_fragment()
+        else:
+            badges = ""
+            if p.get('count') == 0: badges += "<span class='badge badge-visit'>📣加油團</span>"
+            if p.get('isMember') and not roster.is_friend(p): 
+                badges += "<span class='badge badge-sunny'>晴女</span>"
+            if p.get('bringBall'): badges += "<span class='badge badge-ball'>帶球</span>"
+            if p.get('occupyCourt'): badges += "<span class='badge badge-court'>佔場</span>"
+            
+            c_cfg = [7.5, 0.6, 0.6, 1.3] if not (is_admin_mode and is_wait) else [6.0, 1.2, 0.6, 0.6, 1.6]
+            cols = st.columns(c_cfg, gap="small")
+            with cols[0]:
+                st.markdown(f"""<div class="player-row"><span class="{idx_cls}">{idx_str}</span><span class="list-name">{p['name']}</span>{badges}</div>""", unsafe_allow_html=True)
+            b_idx = 1
+            if is_admin_mode and is_wait and p.get('isMember'):
+                with cols[b_idx]:
+                    if st.button("⬆️", key=f"up_{p['id']}"): promote_player(wid=p['id'], d=date_key)
+                b_idx += 1
+            if can_edit_global:
+                if b_idx < len(cols):
+                    if not roster.is_friend(p):
+                        with cols[b_idx]:
+                            if st.button("✏️", key=f"be_{p['id']}"): st.session_state.edit_target = p['id']; rerun_fragment()
+                if b_idx+1 < len(cols):
+                    with cols[b_idx+1]:
+                        with st.popover("❌"):
+                            st.write("確定取消報名嗎？")
+                            if st.button("確認刪除", key=f"conf_del_{p['id']}", type="primary"):
+                                delete_player(pid=p['id'], d=date_key)
+
+# ==========================================
+# 3. 初始化 & CSS (絕對不動)
+# ==========================================
+GID = st.query_params.get("g", DEFAULT_GROUP)
+G = get_groups().get(GID)
+if G is None: st.error(f"❌ 找不到這個團：{GID}"); st.stop()
+# 換團時管理員登入、編輯中、等待中的異動都不帶過去
+if st.session_state.get("group") != GID:
+    st.session_state.group = GID
+    for k in ("is_admin", "edit_target", "pending", "bulk_plan"): st.session_state.pop(k, None)
+if 'is_admin' not in st.session_state: st.session_state.is_admin = False
+if 'edit_target' not in st.session_state: st.session_state.edit_target = None
+if 'pending' not in st.session_state: st.session_state.pending = []
+metrics.begin_run("page")
+
+st.set_page_config(page_title=f"{G['name']}籃球報名", page_icon="☀️", layout="centered") 
+
+st.markdown("""
+    <style>
+    @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+TC:wght@400;500;700;900&display=swap');
+    [data-testid="stAppViewContainer"] { background-color: #f8fafc !important; color: #334155 !important; }
+    html, body, [class*="css"], p, div, label, span, h1, h2, h3, .stMarkdown { font-family: 'Noto Sans TC', sans-serif; color: #334155 !important; }
+    .block-container { padding-top: 4rem !important; padding-bottom: 5rem !important; }
+    header {background: transparent !important;}
+    [data-testid="stDecoration"], [data-testid="stToolbar"], [data-testid="stStatusWidget"], footer, #MainMenu, .stDeployButton {display: none !important;}
+    [data-testid="stSidebarCollapsedControl"] { display: none !important; }
+    .header-box { background: white; padding: 1.5rem 1rem; border-radius: 20px; text-align: center; margin-bottom: 20px; box-shadow: 0 4px 20px rgba(0,0,0,0.03); border: 1px solid #f1f5f9; }
+    .header-title { font-size: 1.6rem; font-weight: 800; color: #1e293b !important; letter-spacing: 1px; margin-bottom: 5px; }
+    .header-sub { font-size: 0.9rem; color: #64748b !important; font-weight: 500; }
+    .info-pill { background: #f1f5f9; padding: 4px 14px; border-radius: 30px; font-size: 0.8rem; font-weight: 600; color: #475569 !important; display: inline-block; margin-top: 10px; }
+    .player-row { background: white; border: 1px solid #f1f5f9; border-radius: 12px; padding: 8px 10px; margin-bottom: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.03); display: flex; align-items: center; width: 100%; min-height: 40px; }
+    .list-index { color: #cbd5e1 !important; font-weight: 700; font-size: 0.9rem; margin-right: 12px; min-width: 20px; text-align: right;}
+    .list-index-flower { color: #f472b6 !important; font-weight: 700; font-size: 1rem; margin-right: 12px; min-width: 20px; text-align: right;}
+    .list-name { color: #334155 !important; font-weight: 700; font-size: 1.15rem; flex-grow: 1; line-height: 1.2; }
+    .badge { padding: 2px 6px; border-radius: 5px; font-size: 0.7rem; font-weight: 700; margin-left: 4px; display: inline-block; vertical-align: middle; }
+    .badge-sunny { background: #fffbeb; color: #d97706 !important; }
+    .badge-ball { background: #fff7ed; color: #c2410c !important; }
+    .badge-court { background: #eff6ff; color: #1d4ed8 !important; }
+    .badge-visit { background: #fdf2f8; color: #db2777 !important; border: 1px solid #fce7f3; }
+    .progress-container { width: 100%; background: #e2e8f0; border-radius: 6px; height: 6px; margin-top: 8px; overflow: hidden; }
+    .progress-bar { height: 100%; border-radius: 6px; transition: width 0.6s ease; }
+    .progress-info { display: flex; justify-content: space-between; font-size: 0.8rem; color: #64748b !important; margin-bottom: 2px; font-weight: 600; }
+    .edit-box { border: 1px solid #3b82f6; border-radius: 12px; padding: 12px; background: #eff6ff; margin-bottom: 10px; }
+    
+    .rules-box { background-color: white; border-radius: 16px; padding: 20px; border: 1px solid #f1f5f9; box-shadow: 0 4px 15px rgba(0,0,0,0.02); margin-top: 15px; }
+    .rules-header { font-size: 1rem; font-weight: 800; color: #334155 !important; margin-bottom: 15px; border-bottom: 2px solid #f1f5f9; padding-bottom: 8px; }
+    .rules-row { display: flex; align-items: flex-start; margin-bottom: 12px; }
+    .rules-icon { font-size: 1.1rem; margin-right: 12px; line-height: 1.4; }
+    .rules-content { font-size: 0.9rem; color: #64748b !important; line-height: 1.5; }
+    .rules-content b { color: #475569 !important; font-weight: 700; }
+    .rules-footer { margin-top: 15px; font-size: 0.85rem; color: #94a3b8 !important; text-align: right; font-weight: 500; }
+    
+    button[data-testid="stBaseButton-secondary"] { width: 100% !important; height: 32px !important; padding: 0 !important;}
+    </style>
+""", unsafe_allow_html=True)
+
+# ==========================================
+# 4. 主畫面內容
+# ==========================================
+st.markdown(f"""<div class="header-box"><div class="header-title">{G['title']}</div><div class="header-sub">✨ Keep Playing, Keep Shining ✨</div><div class="info-pill">📍 {G['venue']} &nbsp;|&nbsp; 🕒 {G['time']}</div></div>""", unsafe_allow_html=True)
+st.session_state.data = load_data()
+if get_cache(GID).stale: st.warning("⚠️ 暫時連不上 Google Sheets，目前顯示的是稍早的名單，剛送出的報名可能還沒出現")
+archive_old_sessions(); show_flash(); check_pending()
+st.session_state.seen_ver = get_cache(GID).db.ver  # 這次畫面用的版本，心跳拿來比對
+
+# 請假與公報 (獨立 fragment，刪假單只重跑這一塊)
+@st.fragment
+def leave_section():
+    metrics.begin_fragment()
+    show_flash()
+    data = load_data()
+    li = get_leaves(GID).get(data["leaves"])  # 跨分頁共用的假單索引 (見 leaves.py)，快照換新時只同步有變動的人
+    c_l1, c_l2 = st.columns(2)
+    with c_l1:
+        with st.expander("🏖️ 我要請假 (長假登記)"):
+            with st.form("l_form", clear_on_submit=True):
+                n = st.text_input("姓名")
+                m = st.date_input("請假月份")
+                if st.form_submit_button("送出假單") and n:
+                    s = m.strftime("%Y-%m")
+                    if li.on_leave(n, s): st.info(f"{s} 已經登記過了")
+                    elif mutate("add_leave", name=n, month=s): flash("✅ 已登記", scope="fragment")
+
+    with c_l2:
+        with st.expander("📜 休假公報", expanded=False):
+            people = li.people()
+            if people:
+                for low_n, disp_n, m_list in people:
+                    col_info, col_manage = st.columns([0.82, 0.18])
+                    with col_info:
+                        st.markdown(f"**👤 {disp_n}**: {', '.join(m_list)}")
+                    with col_manage:
+                        with st.popover("🗑️"):
+                            st.write(f"管理 {disp_n} 的假單：")
+                            for m_item in m_list:
+                                if st.button(f"刪除 {m_item}", key=f"del_final_{low_n}_{m_item}"):
+                                    if mutate("remove_leave", low_n=low_n, month=m_item): flash(f"🗑️ 已移除 {m_item}", scope="fragment")
+                            st.divider()
+                            if st.button("🚨 強制刪除此人", key=f"f_dl_{low_n}", type="secondary"):
+                                if mutate("remove_leave", low_n=low_n): flash("🗑️ 已強制移除", scope="fragment")
+            else: st.info("目前無人請假")
+
+leave_section()
+
+# 場次顯示：一次只建目前選到的場次；每個場次是獨立 fragment，名單上的編輯 / 刪除 / 遞補只重跑該場次
+@st.fragment
+def session_view(dk):
+    metrics.begin_fragment()
+    show_flash()
+    data = load_data()
+    if dk not in data["sessions"]: st.info("這個場次已關閉"); return
+    try:
+        dt = datetime.strptime(dk, "%Y-%m-%d")
+        locked = datetime.now() > (dt - timedelta(days=1)).replace(hour=12, minute=0)
+    except: locked = False
+    can_edit = st.session_state.is_admin or (not locked)
+    with metrics.span("roster"):
+        ros = get_rosters(GID).get(dk, data["sessions"][dk])
+    main, wait, curr = ros.main, ros.wait, ros.main_count
+    b_c, c_c = ros.balls, ros.courts
+    pct = min(100, (curr/G['capacity'])*100)
+    
+    color_code = '#4ade80' if pct < 50 else '#fbbf24' if pct < 85 else '#f87171'
+    p_html = f'<div class="progress-info"><span>正選 ({curr}/{G["capacity"]})</span><span>候補: {len(wait)}</span></div>'
+    b_html = f'<div class="progress-container"><div class="progress-bar" style="width: {pct}%; background: {color_code};"></div></div>'
+    s_html = f'<div style="display: flex; justify-content: flex-end; gap: 15px; font-size: 0.85rem; color: #64748b; margin-bottom: 25px; font-weight: 500; padding-right: 5px;"><span>🏀 帶球：<b>{b_c}</b></span><span>🚩 佔場：<b>{c_c}</b></span></div>'
+    st.markdown(f'<div style="margin-bottom: 5px; padding: 0 4px;">{p_html}{b_html}</div>{s_html}', unsafe_allow_html=True)
+
+    with st.expander("📝 點擊報名 / 規則說明", expanded=not locked):
+        if locked and not st.session_state.is_admin: st.warning("⛔ 已截止報名")
+        with st.form(f"f_{dk}", clear_on_submit=True):
+            name = st.text_input("球員姓名", disabled=not can_edit)
+            c1, c2, c3 = st.columns(3)
+            im = c1.checkbox("⭐晴女", key=f"m_{dk}", disabled=not can_edit)
+            bb = c2.checkbox("🏀帶球", key=f"b_{dk}", disabled=not can_edit)
+            oc = c3.checkbox("🚩佔場", key=f"c_{dk}", disabled=not can_edit)
+            ev = st.checkbox("📣 不打球 (加油團)", key=f"v_{dk}", disabled=not can_edit)
+            tot = st.number_input("報名人數", 1, 3, 1, key=f"t_{dk}", disabled=not can_edit)
+            if st.form_submit_button("送出報名", disabled=not can_edit, type="primary"):
+                # 報名的月份有登記請假：照樣報名，但提醒她去刪假單
+                on_leave = name and get_leaves(GID).get(data["leaves"]).on_leave(name, dk[:7])
+                if name and mutate("add_regs", d=dk, name=name, im=im, bb=bb, oc=oc, ev=ev, tot=tot, ts=time.time(), ids=[codec.new_id() for _ in range(tot)]):
+                    flash("🎉 報名成功！" + (f"\n⚠️ 妳登記了 {dk[:7]} 請假，要來打球的話記得到「休假公報」刪掉假單" if on_leave else ""), balloons=True, scope="fragment")
+
+        st.markdown(f"""
+        <div class="rules-box">
+            <div class="rules-header">📌 報名須知</div>
+            <div class="rules-row"><span class="rules-icon">🔴</span><div class="rules-content"><b>資格與規範</b>：採實名制。僅限 <b>⭐晴女</b> 報名。欲事後補報朋友，請用原名再次填寫即可 (含自己上限3位)。</div></div>
+            <div class="rules-row"><span class="rules-icon">🟡</span><div class="rules-content"><b>📣加油團</b>：團員若「不打球但帶朋友」請勾此項。本人不佔名額，但朋友會佔打球名額。</div></div>
+            <div class="rules-row"><span class="rules-icon">🟢</span><div class="rules-content"><b>遞補機制</b>：正選 {G['capacity']} 人。候補名單中之 <b>⭐晴女</b>，享有優先遞補「非晴女」之權利。</div></div>
+            <div class="rules-footer">有任何問題請找最美管理員們 ❤️</div>
+        </div>
+        """, unsafe_allow_html=True)
+
+    st.subheader("🏀 報名名單")
+    render_list(main, dk, False, can_edit, st.session_state.is_admin)
+    if wait:
+        st.markdown("<br>", unsafe_allow_html=True); st.subheader("⏳ 候補名單")
+        render_list(wait, dk, True, can_edit, st.session_state.is_admin)
+
+all_d = sorted(st.session_state.data["sessions"].keys())
+h_d = st.session_state.data.get("hidden", [])
+dates = [d for d in all_d if d not in h_d]
+get_rosters(GID).prune(dates)
+
+if not dates: st.info("👋 目前沒有開放報名的場次")
+else:
+    sel = st.segmented_control("場次", dates, default=dates[0], key="sel_date", label_visibility="collapsed",
+                               format_func=lambda d: f"{int(d.split('-')[1])}/{int(d.split('-')[2])}")
+    session_view(sel if sel in dates else dates[0])
+
+# 心跳：每 LIVE_REFRESH 秒查一次版本號 (節流過的小讀取)，有人改過名單才整頁重跑，沒變就什麼都不做
+@st.fragment(run_every=LIVE_REFRESH)
+def heartbeat():
+    metrics.begin_fragment()
+    with metrics.span("heartbeat"):
+        changed = get_cache(GID).version() != st.session_state.seen_ver
+    if changed: st.rerun()
+
+heartbeat()
+
+# ==========================================
+# 5. 管理員專區 (優化報表邏輯)
+# ==========================================
+st.markdown("<br><br><br>", unsafe_allow_html=True); st.divider()
+st.markdown("<div style='text-align: center; color: #cbd5e1; font-size: 0.8rem;'>▼ 管理員專用通道 ▼</div>", unsafe_allow_html=True)
+with st.expander("⚙️ 管理員專區 (Admin)", expanded=st.session_state.is_admin):
+    if not st.session_state.is_admin:
+        if not G["password"]: st.warning(f"⚠️ 這團還沒設定管理員密碼，請在 secrets 的 [groups.{GID}] 加上 password")
+        elif st.text_input("密碼", key="admin_pwd_input", type="password") == G["password"]: st.session_state.is_admin = True; st.rerun()
+    else:
+        if st.button("登出"): st.session_state.is_admin = False; st.rerun()
+        st.subheader("管理功能")
+        nd = st.date_input("新增日期")
+        if st.button("新增場次"):
+            if str(nd) not in st.session_state.data["sessions"] and mutate("add_session", d=str(nd)): st.rerun()
+
+        # 批次作業 (見 bulk.py)：先預覽差異，確認後整批一次寫入
+        st.subheader("批次作業")
+        data = st.session_state.data
+        all_s = sorted(data["sessions"].keys())
+        t_sch, t_sel, t_io = st.tabs(["📅 週期排程", "🗂️ 多選刪除 / 隱藏", "📥 匯入 / 匯出"])
+        with t_sch:
+            c_s1, c_s2 = st.columns(2)
+            s_from = c_s1.date_input("從", key="sch_from")
+            s_to = c_s2.date_input("到", date.today() + timedelta(days=90), key="sch_to")
+            s_wd = st.multiselect("每週", list(range(7)), default=[2], format_func=lambda i: f"星期{bulk.WEEKDAYS[i]}", key="sch_wd")
+            s_skip = st.text_area("跳過的日期 (假日)", placeholder="2025-04-04, 2025-05-01", key="sch_skip")
+            if st.button("預覽排程", key="sch_go"):
+                try: skip = bulk.parse_dates(s_skip)
+                except ValueError as e: st.error(f"日期格式不對：{e}")
+                else:
+                    new = [d for d in bulk.schedule(s_from, s_to, s_wd, skip) if d not in data["sessions"]]
+                    if new: plan_bulk(f"週期排程 {len(new)} 場", [mutations.make("add_session", d=d) for d in new])
+                    else: st.info("這段期間沒有要新增的場次")
+        with t_sel:
+            hidden = set(data.get("hidden", []))
+            sel = st.multiselect("場次", all_s, key="bulk_sel", format_func=lambda d: f"{d} (隱藏中)" if d in hidden else d)
+            c_b1, c_b2, c_b3 = st.columns(3)
+            if c_b1.button("🗑️ 刪除", key="bulk_del", disabled=not sel): plan_bulk(f"刪除 {len(sel)} 場", [mutations.make("delete_session", d=d) for d in sel])
+            if c_b2.button("🙈 隱藏", key="bulk_hide", disabled=not sel): plan_bulk(f"隱藏 {len(sel)} 場", [mutations.make("hide_sessions", dates=sel)])
+            if c_b3.button("👀 取消隱藏", key="bulk_show", disabled=not sel): plan_bulk(f"取消隱藏 {len(sel)} 場", [mutations.make("hide_sessions", dates=sel, hidden=False)])
+            lv = [(k, n, m) for k, n, mons in get_leaves(GID).get(data["leaves"]).people() for m in mons]
+            sel_l = st.multiselect("假單", lv, key="bulk_leaves", format_func=lambda x: f"{x[1]} {x[2]}")
+            if st.button("🗑️ 刪除假單", key="bulk_del_l", disabled=not sel_l):
+                plan_bulk(f"刪除 {len(sel_l)} 筆假單", [mutations.make("remove_leave", low_n=k, month=m) for k, _, m in sel_l])
+        with t_io:
+            st.caption("匯出目前的場次、名單與假單 (不含歸檔)。匯入用同樣格式，只會新增沒有的場次 / 報名 / 假單，不會刪除或覆蓋")
+            c_x1, c_x2 = st.columns(2)
+            c_x1.download_button("⬇️ 匯出 CSV", bulk.export_csv(data), file_name=f"{GID}_{date.today()}.csv", mime="text/csv")
+            c_x2.download_button("⬇️ 匯出 JSON", bulk.export_json(data), file_name=f"{GID}_{date.today()}.json", mime="application/json")
+            up = st.file_uploader("匯入檔案", type=["csv", "json"], key="bulk_file")
+            if st.button("預覽匯入", key="bulk_import", disabled=up is None):
+                try: inc = bulk.load_file(up.name, up.getvalue())
+                except Exception as e: st.error(f"❌ 讀不懂這個檔案：{e}")
+                else:
+                    muts = bulk.import_ops(data, inc)
+                    if muts: plan_bulk(f"匯入 {up.name}", muts)
+                    else: st.info("檔案裡的資料都已經有了")
+
+        plan = st.session_state.get("bulk_plan")
+        if plan:
+            st.markdown(f"**預覽：{plan['label']}** ({len(plan['muts'])} 筆異動，確認後一次寫入)")
+            if plan["diff"]: st.dataframe(plan["diff"], hide_index=True)
+            else: st.info("套用後資料不會有變動")
+            if plan["skip"]: st.warning("會略過：" + "；".join(plan["skip"]))
+            c_p1, c_p2 = st.columns(2)
+            if c_p1.button("✅ 確認套用", key="bulk_ok", type="primary"):
+                st.session_state.bulk_plan = None
+                res = mutate("bulk", muts=plan["muts"])
+                if res is not None:
+                    bad = sum(isinstance(r, Exception) for r in res)
+                    flash(f"✅ {plan['label']}：完成 {len(res) - bad} 筆" + (f"，略過 {bad} 筆" if bad else ""))
+            if c_p2.button("取消", key="bulk_cancel"): st.session_state.bulk_plan = None; st.rerun()
+        
+        # 效能監測：整個程序共用的 span 紀錄 (見 metrics.py)，開自動更新時每 5 秒重跑這一塊
+        st.subheader("效能監測")
+        st.toggle("自動更新", key="perf_live")
+        @st.fragment(run_every=5 if st.session_state.perf_live else None)
+        def perf_panel():
+            cs, ws = get_cache(GID).stats(), get_writer(GID).stats()
+            st.caption(f"快取命中 {cs['hits']} / 未命中 {cs['misses']} (命中率 {cs['hit_rate']:.0%})，資料版本 v{cs['version']}" + ("，⚠️ 目前是舊快照" if cs['stale'] else ""))
+            st.caption(f"寫入佇列：{ws['mutations']} 筆異動合併成 {ws['flushes']} 次寫入 (平均每次 {ws['per_flush']:.1f} 筆)，排隊中 {ws['queued']}" + (f"，⚠️ 寫入失敗重試中 (第 {ws['retrying']} 次)" if ws['retrying'] else ""))
+            c = metrics.counters()
+            n_api = sum(v for k, v in c.items() if k.startswith("sheets.") and k not in ("sheets.bytes_in", "sheets.bytes_out", "sheets.errors"))
+            st.caption(f"Sheets API {n_api} 次 (失敗 {c.get('sheets.errors', 0)}，重試 {c.get('quota.retries', 0)}，限流等待 {c.get('quota.wait_ms', 0)/1000:.1f} 秒)，收 {c.get('sheets.bytes_in', 0)/1024:.1f} KB、送 {c.get('sheets.bytes_out', 0)/1024:.1f} KB")
+            st.dataframe(metrics.summary(), hide_index=True)
+            st.caption("最近的 rerun")
+            st.dataframe(metrics.runs(), hide_index=True)
+            m1, m2 = st.columns(2)
+            m1.download_button("⬇️ 匯出 JSON", metrics.export(cache=cs, writer=ws), file_name=f"metrics_{datetime.now():%Y%m%d_%H%M%S}.json", mime="application/json")
+            if m2.button("清除紀錄"): metrics.reset(); rerun_fragment()
+        perf_panel()
+
+        st.subheader("出席統計")
+        c_r1, c_r2 = st.columns(2)
+        if c_r1.button("📊 產生報表"):
+            today = str(date.today())
+            # 有場次跨過今天才需要先結算一次，平常直接讀物化表
+            if st.session_state.data["stats"]["through"] < today: mutate("rollover_stats", today=today)
+            try:
+                data = load_data()
+                st.table(stats.report(data, leaves=get_leaves(GID).get(data["leaves"])))
+            except Exception:
+                st.error("統計失敗")
+        if c_r2.button("🔁 重建統計"):
+            cur = st.session_state.data["stats"]
+            # 歸檔讀不到就整個不做，不能拿缺了歸檔的結果蓋掉統計
+            try: archived = get_db_connection(GID).load_all_archives()
+            except storage.StorageUnavailable as e: archived = None; st.error(f"❌ 讀不到歸檔場次，未重建：{e}")
+            if archived is not None:
+                today = str(date.today())
+                if cur["through"]:
+                    fresh = stats.rebuild(st.session_state.data["sessions"], cur["through"], stats.rebuild(archived, cur["through"]))
+                    bad = [k for k in set(fresh) | set(cur["members"]) if fresh.get(k) != cur["members"].get(k)]
+                else: bad = []
+                if mutate("rebuild_stats", today=today, base=stats.rebuild(archived, today)) is not None:
+                    st.success(f"✅ 已重建統計；原統計 (結算到 {cur['through'] or '無'}) 與重算不一致 {len(bad)} 人")
+
+        months = get_db_connection(GID).archive_months()
+        if months:
+            with st.expander("📚 歷史場次 (歸檔)"):
+                h_m = st.selectbox("月份", months[::-1], key="hist_month")
+                try: arch = get_db_connection(GID).load_archive(h_m)
+                except storage.StorageUnavailable as e: st.warning(f"⚠️ 暫時讀不到 {h_m} 的歸檔：{e}"); arch = {}
+                for hd, pl in sorted(arch.items()):
+                    eng = roster.RosterEngine(G["capacity"], pl)
+                    st.markdown(f"**{hd}** 正選 {eng.main_count}/{G['capacity']}，候補 {eng.wait_count}")
+                    st.caption("、".join(p['name'] for p in eng.main()) + (f"｜候補：{'、'.join(p['name'] for p in eng.wait())}" if eng.wait_count else ""))
+
+        st.divider()
+        if st.button("🧹 一鍵清洗現有錯誤標籤"):
+            count = mutate("clean_member_flags")
+            if count is not None: flash(f"🧹 清洗完成！共修正 {count} 筆。")
+        if st.button("🔗 連結朋友與團員 (舊資料補 owner)"):
+            count = mutate("link_owners")
+            if count is not None: flash(f"🔗 連結完成！共補上 {count} 筆。")
+
+        if DB_BACKEND == "sheets" and GID == DEFAULT_GROUP:  # A1 舊格式只有原本這一團有
+            st.divider()
+            st.caption("舊版資料存在 sheet1 的 A1 單格；新版改為每人一列 (players / leaves / sessions 工作表)。遷移只補新版沒有的資料，可以重複按")
+            if st.button("📦 從 A1 舊格式遷移"):
+                try:
+                    old, muts, res = storage.migrate(storage.BlobStorage(get_spreadsheet(G["sheet"])), get_cache(GID), bulk.import_ops, mutations.apply_all)
+                    if isinstance(res, Exception): raise res
+                    n_p = sum(r for m, r in zip(muts, res) if m["op"] == "import_players" and isinstance(r, int))
+                    flash(f"📦 遷移完成！A1 共 {len(old['sessions'])} 場，補上 {n_p} 筆報名 (已有的略過)。")
+                except Exception as e:
+                    st.error(f"遷移失敗：{e}")
+
+metrics.end_run()
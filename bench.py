@@ -0,0 +1,414 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from unittest import mock
+
+import requests
+import gspread
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import codec
+import mutations
+import quota
+import storage
+import writer
+
+# ==========================================
+# 效能測試：不連 Google，用記憶體裡的假試算表 (可設定延遲 / 配額錯誤) 跑 app.py，
+# 資料用 mutations 的 op 產生 (跟正式報名走同一條路，朋友 owner、加油團、請假、統計都對得上)，
+# 再用 streamlit 的 AppTest 無頭執行各情境，回報延遲百分位、Sheets 呼叫次數 / 傳輸量、記憶體。
+# 同一份合成資料也拿來比較 codec.py 各格式的大小與速度 (來回一致性由 test_codec.py 檢查)，--codec-only 只跑這項。
+#   python bench.py                           # 預設 60 場 x 每場 30 人
+#   python bench.py --sessions 200 --players 40 --latency 0.08 --quota 60 --out bench_output.txt
+# ==========================================
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+ADMIN_PASSWORD = "sunny"
+BURST_DATE = "2099-12-31"
+
+
+# ---------- 假的 gspread 試算表 ----------
+def _col(c):
+    n = 0
+    for ch in c: n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _api_error(code, msg):
+    r = requests.Response()
+    r.status_code = code
+    r._content = json.dumps({"error": {"code": code, "message": msg, "status": "BENCH"}}).encode()
+    return gspread.exceptions.APIError(r)
+
+
+class FakeWorksheet:
+    def __init__(self, ss, title, rows, cols):
+        self.ss, self.title, self.row_count, self.cells = ss, title, rows, {}
+        self.id = len(ss.tabs)
+
+
+class FakeSpreadsheet:
+    # latency：每次呼叫固定延遲 (秒)；quota：每 60 秒最多幾次呼叫，超過丟 429；error_rate：隨機 503 的機率
+    def __init__(self, latency=0.0, quota=None, error_rate=0.0, seed=0):
+        self.latency, self.quota, self.error_rate = latency, quota, error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.tabs = {}
+        self.sheet1 = FakeWorksheet(self, "Sheet1", 1000, 26)
+        self.tabs["Sheet1"] = self.sheet1
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.calls, self.errors, self.bytes_in, self.bytes_out = Counter(), Counter(), 0, 0
+        self._window = []
+
+    def _call(self, name, payload=None):
+        with self.lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 60] + [now]
+            self.calls[name] += 1
+            if payload is not None: self.bytes_out += len(json.dumps(payload, ensure_ascii=False).encode())
+            if self.quota and len(self._window) > self.quota:
+                self.errors[429] += 1; raise _api_error(429, "Quota exceeded (bench)")
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors[503] += 1; raise _api_error(503, "Service unavailable (bench)")
+        if self.latency: time.sleep(self.latency)
+
+    def _read(self, vals):
+        self.bytes_in += len(json.dumps(vals, ensure_ascii=False).encode())
+        return vals
+
+    def _parse(self, rng):
+        t, a = rng.rsplit("!", 1)
+        if t.startswith("'"): t = t[1:-1].replace("''", "'")
+        m = re.match(r"([A-Z]+)(\d+)(?::([A-Z]+)(\d*))?$", a)
+        r2 = int(m[4]) if m[4] else (None if m[3] else int(m[2]))
+        return self.tabs[t], _col(m[1]), int(m[2]), _col(m[3] or m[1]), r2
+
+    def _get(self, rng):
+        w, c1, r1, c2, r2 = self._parse(rng)
+        if r2 is None: r2 = max([r for r, _ in w.cells] + [0])
+        out = [[w.cells.get((r, c), "") for c in range(c1, c2 + 1)] for r in range(r1, r2 + 1)]
+        for row in out:
+            while row and row[-1] == "": row.pop()
+        while out and not out[-1]: out.pop()
+        return out
+
+    def _set(self, rng, vals):
+        w, c1, r1, _, _ = self._parse(rng)
+        if r1 + len(vals) - 1 > w.row_count: raise _api_error(400, f"{rng} exceeds grid limits")
+        for i, row in enumerate(vals):
+            for j, v in enumerate(row): w.cells[(r1 + i, c1 + j)] = v
+
+    def worksheets(self):
+        self._call("worksheets"); return list(self.tabs.values())
+
+    def worksheet(self, title):
+        self._call("worksheet"); return self.tabs[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self._call("add_worksheet")
+        with self.lock:
+            w = self.tabs[title] = FakeWorksheet(self, title, rows, cols)
+        return w
+
+    def batch_update(self, body):
+        # 只支援加列 (appendDimension)，SheetStorage 列數不夠時用
+        self._call("batch_update", body["requests"])
+        with self.lock:
+            for r in body["requests"]:
+                a = r["appendDimension"]
+                next(w for w in self.tabs.values() if w.id == a["sheetId"]).row_count += a["length"]
+
+    def values_get(self, rng, params=None):
+        self._call("values_get")
+        with self.lock: return {"values": self._read(self._get(rng))}
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("values_batch_get")
+        with self.lock: return {"valueRanges": [{"values": self._read(self._get(r))} for r in ranges]}
+
+    def values_update(self, rng, params=None, body=None):
+        self._call("values_update", body["values"])
+        with self.lock: self._set(rng, body["values"])
+
+    def values_batch_update(self, body):
+        self._call("values_batch_update", body["data"])
+        with self.lock:
+            for d in body["data"]: self._set(d["range"], d["values"])
+
+    def values_append(self, rng, params=None, body=None):
+        self._call("values_append", body["values"])
+        with self.lock:
+            w = self.tabs[rng.split("!")[0]]
+            last = max([r for r, _ in w.cells] + [0])
+            w.row_count = max(w.row_count, last + len(body["values"]))
+            for i, row in enumerate(body["values"]):
+                for j, v in enumerate(row): w.cells[(last + 1 + i, 1 + j)] = v
+
+
+class FakeClient:
+    def __init__(self, ss): self.ss = ss
+    def open(self, name): return self.ss
+
+
+# ---------- 合成資料 ----------
+def generate(n_sessions, n_players, future=2, seed=1, today=None):
+    # 每週一場，最後 future 場在今天之後；每場約 n_players 人 (含朋友與加油團)，另有約一成團員請長假
+    rng = random.Random(seed)
+    today = today or date.today()
+    pool = [f"團員{i:03d}" for i in range(max(10, n_players * 3 // 2))]
+    data = storage.empty_data()
+    muts = []
+    first = today - timedelta(weeks=n_sessions - future)
+    for s in range(n_sessions):
+        d = str(first + timedelta(weeks=s))
+        new_id = codec.new_id if d >= str(today) else lambda: str(uuid.uuid4())  # 舊場次用以前的 UUID id
+        muts.append(mutations.make("add_session", d=d))
+        ts, n = time.mktime((first + timedelta(weeks=s, days=-3)).timetuple()), 0
+        for name in rng.sample(pool, len(pool)):
+            if n >= n_players: break
+            tot = min(rng.choice([1, 1, 1, 1, 2, 2, 3]), n_players - n)
+            ev = tot > 1 and rng.random() < 0.3
+            ts += rng.uniform(30, 600)
+            muts.append(mutations.make("add_regs", d=d, name=name, im=True, bb=rng.random() < 0.2, oc=rng.random() < 0.1,
+                                       ev=ev, tot=tot, ts=ts, ids=[new_id() for _ in range(tot)]))
+            n += tot
+    for name in rng.sample(pool, len(pool) // 10):
+        m0 = today.replace(day=1)
+        for k in range(rng.randint(1, 3)):
+            muts.append(mutations.make("add_leave", name=name, month=(m0 + timedelta(days=31 * (k - 1))).strftime("%Y-%m")))
+    muts.append(mutations.make("rollover_stats", today=str(today)))
+    bad = [r for r in mutations.apply_all(data, muts) if isinstance(r, Exception)]
+    if bad: raise RuntimeError(f"合成資料失敗：{bad[0]}")
+    return data
+
+
+# ---------- 編碼來回檢查 (codec.py) ----------
+def codec_check(data):
+    # 精簡編碼的大小與速度 (來回是否一致由 test_codec.py 檢查)
+    legacy, j1, z1 = 0, 0, 0
+    t_enc = t_dec = 0.0
+    for pl in data["sessions"].values():
+        for compress in (False, True):
+            t = time.perf_counter(); s = codec.encode_players(pl, compress); t_enc += time.perf_counter() - t
+            t = time.perf_counter(); codec.decode_players(s); t_dec += time.perf_counter() - t
+            if compress: z1 += len(s)
+            else: j1 += len(s)
+        legacy += len(json.dumps(pl, ensure_ascii=False))
+    blob_old, blob_new = json.dumps(data, ensure_ascii=False), codec.encode_data(data)
+    n = 2 * len(data["sessions"]) or 1
+    return {"sessions": len(data["sessions"]), "legacy_kb": legacy / 1024, "j1_kb": j1 / 1024, "z1_kb": z1 / 1024,
+            "blob_legacy_kb": len(blob_old) / 1024, "blob_z1_kb": len(blob_new) / 1024,
+            "encode_ms": t_enc * 1000 / n, "decode_ms": t_dec * 1000 / n}
+
+
+# ---------- 測試環境 ----------
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="bench_")
+        self.ss = None
+        self.patches = [mock.patch("gspread.authorize", side_effect=lambda creds: FakeClient(self.ss)),
+                        mock.patch("oauth2client.service_account.ServiceAccountCredentials.from_json_keyfile_dict", return_value=None)]
+        self.results = []
+
+    def seed(self):
+        # 換一份全新的假試算表並清掉 app 的共用資源 (快取 / 寫入佇列)，過期場次先歸檔好，模擬平常的狀態
+        a = self.args
+        ss = FakeSpreadsheet(seed=a.seed)
+        db = storage.SheetStorage(ss)
+        db.save(generate(a.sessions, a.players, a.future, a.seed))
+        cutoff = str(date.today() - timedelta(days=14))
+        storage.SnapshotCache(db).archive(cutoff, lambda data: 0)
+        ss.latency, ss.quota, ss.error_rate = a.latency, a.quota, a.error_rate
+        ss.reset_counters()
+        self.ss = ss
+        self.target = max(db.load()["sessions"])  # 還沒截止的最後一場
+        os.environ["JOURNAL_PATH"] = os.path.join(self.tmp, f"journal_{uuid.uuid4().hex}.jsonl")
+        st.cache_resource.clear()
+
+    def app(self, admin=False):
+        at = AppTest.from_file(APP, default_timeout=self.args.timeout)
+        at.secrets["gcp_service_account"] = {"bench": True}
+        at.run()
+        at.button_group(key="sel_date").set_value(self.target).run()
+        if admin: at.text_input(key="admin_pwd_input").input(ADMIN_PASSWORD).run()
+        return at
+
+    def measure(self, name, step, iters, prepare=None):
+        # prepare() 不計時也不算呼叫次數；step() 回傳 (延遲清單, 錯誤數)。最後多跑一輪開 tracemalloc 量記憶體高峰
+        lat, errs, n = [], 0, 0
+        calls, api_err, b_in, b_out = Counter(), Counter(), 0, 0
+        for _ in range(iters):
+            ctx = prepare() if prepare else None
+            c0, e0, i0, o0 = self.ss.calls.copy(), self.ss.errors.copy(), self.ss.bytes_in, self.ss.bytes_out
+            l, e = step(ctx)
+            if l is None: break
+            calls += self.ss.calls - c0; api_err += self.ss.errors - e0
+            b_in += self.ss.bytes_in - i0; b_out += self.ss.bytes_out - o0
+            lat += l; errs += e; n += 1
+        peak = None
+        if n and not self.args.no_memory:
+            ctx = prepare() if prepare else None
+            tracemalloc.start()
+            step(ctx)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        k = max(n, 1)
+        self.results.append({"scenario": name, "samples": len(lat), "iterations": n, "errors": errs, **percentiles(lat),
+                             "sheets_calls": sum(calls.values()) / k, "calls_by_method": {m: c / k for m, c in calls.items()},
+                             "api_errors": dict(api_err), "kb_read": b_in / 1024 / k, "kb_written": b_out / 1024 / k,
+                             "peak_kb": peak / 1024 if peak is not None else None})
+
+    def run(self):
+        for p in self.patches: p.start()
+        try:
+            self.seed()
+            self.measure("cold_load", lambda _: timed(self.app), self.args.iters, prepare=self.seed)
+            self.seed()
+            self.app()
+            self.measure("warm_load", lambda _: timed(self.app), self.args.iters)
+            at = self.app()
+            self.measure("rerun", lambda _: timed(at.run), self.args.iters)
+            self.measure("signup", self.signup, self.args.iters, prepare=self.signup_user)
+            self.measure("signup_burst", self.signup_burst, self.args.iters, prepare=self.burst_writer)
+            admin = self.app(admin=True)
+            self.measure("promote", lambda _: self.promote(admin), self.args.iters)
+            self.measure("report", lambda _: self.report(admin), self.args.iters)
+        finally:
+            for p in self.patches: p.stop()
+        return self.results
+
+    # ---------- 情境 ----------
+    def signup_user(self):
+        at = self.app()
+        next(t for t in at.text_input if t.label == "球員姓名").input(f"快閃{uuid.uuid4().hex[:6]}")
+        at.checkbox(key=f"m_{self.target}").check()
+        return at
+
+    def signup(self, at):
+        t = time.perf_counter()
+        next(b for b in at.button if b.label == "送出報名").click().run()
+        return [time.perf_counter() - t], int(bool(at.exception or at.error or not any("報名成功" in x.value for x in at.toast)))
+
+    def burst_writer(self):
+        # AppTest 共用一個全域 Runtime，不能多個同時跑；同時報名改成直接打 app 背後同一套寫入路徑
+        # (SnapshotCache + WriteBehind，跟 app 的 mutate() 一樣送出後等 Future)，量的是多人同時送出時的排隊與合併
+        # 跟 app 一樣包一層 Throttled (限流 + 429/5xx 重試)，--error-rate 的隨機錯誤才不會直接打斷這個情境
+        ss = quota.Throttled(self.ss, quota.TokenBucket(60), quota.TokenBucket(60))
+        cache = storage.SnapshotCache(storage.SheetStorage(ss))
+        w = writer.WriteBehind(cache, mutations.apply_all, None, self.args.window)
+        w.submit(mutations.make("add_session", d=BURST_DATE)).result()  # 另開一場，不影響後面遞補情境用的場次
+        return w
+
+    def signup_burst(self, w):
+        lat, errs, lock = [], [0], threading.Lock()
+        go = threading.Barrier(self.args.burst)
+
+        def one():
+            go.wait()
+            t = time.perf_counter()
+            fut = w.submit(mutations.make("add_regs", d=BURST_DATE, name=f"快閃{uuid.uuid4().hex[:6]}", im=True, bb=False, oc=False,
+                                          ev=False, tot=1, ts=time.time(), ids=[codec.new_id()]))
+            try: fut.result(timeout=self.args.timeout)
+            except Exception:
+                with lock: errs[0] += 1
+            with lock: lat.append(time.perf_counter() - t)
+        ths = [threading.Thread(target=one) for _ in range(self.args.burst)]
+        for t in ths: t.start()
+        for t in ths: t.join()
+        return lat, errs[0]
+
+    def promote(self, admin):
+        btn = next((b for b in admin.button if b.key and b.key.startswith("up_")), None)
+        if btn is None: return ([], 1) if admin.exception else (None, 0)  # 沒有可遞補的候補就結束
+        t = time.perf_counter()
+        btn.click().run()
+        return [time.perf_counter() - t], int(bool(admin.exception or admin.error))
+
+    def report(self, admin):
+        t = time.perf_counter()
+        next(b for b in admin.button if b.label == "📊 產生報表").click().run()
+        return [time.perf_counter() - t], int(bool(admin.exception or admin.error or not admin.table))
+
+
+def timed(fn):
+    t = time.perf_counter()
+    at = fn()
+    return [time.perf_counter() - t], int(bool(at is not None and (at.exception or at.error)))
+
+
+def percentiles(xs):
+    if not xs: return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    xs = sorted(xs)
+    pick = lambda q: xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))] * 1000
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": xs[-1] * 1000}
+
+
+def render_codec(c):
+    return "\n".join([f"# 編碼 ({c['sessions']} 場)：舊版 json {c['legacy_kb']:.1f} KB -> j1 {c['j1_kb']:.1f} KB ({c['j1_kb'] / c['legacy_kb']:.0%})"
+                      f" / z1 {c['z1_kb']:.1f} KB ({c['z1_kb'] / c['legacy_kb']:.0%})；整份 A1 {c['blob_legacy_kb']:.1f} KB -> {c['blob_z1_kb']:.1f} KB",
+                      f"  每場編碼 {c['encode_ms']:.3f} ms、解碼 {c['decode_ms']:.3f} ms"])
+
+
+def render(results, args):
+    f = lambda v, spec: format(v, spec) if v is not None else "-".rjust(int(spec.split(".")[0]))
+    lines = [f"# {args.sessions} 場 x {args.players} 人，延遲 {args.latency * 1000:.0f}ms，配額 {args.quota or '無'}/分，錯誤率 {args.error_rate:.0%}",
+             f"{'情境':<14}{'樣本':>6}{'錯誤':>6}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'maxms':>9}{'Sheets次/輪':>12}{'讀KB':>9}{'寫KB':>9}{'記憶體KB':>10}"]
+    for r in results:
+        lines.append(f"{r['scenario']:<14}{r['samples']:>6}{r['errors']:>6}{f(r['p50_ms'], '9.1f')}{f(r['p95_ms'], '9.1f')}"
+                     f"{f(r['p99_ms'], '9.1f')}{f(r['max_ms'], '9.1f')}{r['sheets_calls']:>12.1f}{r['kb_read']:>9.1f}"
+                     f"{r['kb_written']:>9.1f}{f(r['peak_kb'], '10.0f')}")
+    for r in results:
+        if r["api_errors"]: lines.append(f"{r['scenario']}: API 錯誤 {r['api_errors']}")
+    lines.append(f"程序最大 RSS：{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="晴女籃球報名 效能測試")
+    ap.add_argument("--sessions", type=int, default=60, help="場次數 (含歸檔)")
+    ap.add_argument("--players", type=int, default=30, help="每場人數")
+    ap.add_argument("--future", type=int, default=2, help="今天之後的場次數")
+    ap.add_argument("--iters", type=int, default=10, help="每個情境跑幾輪")
+    ap.add_argument("--burst", type=int, default=20, help="同時報名的人數")
+    ap.add_argument("--window", type=float, default=0.3, help="寫入佇列合併時間窗 (秒，同 app.py 的 WRITE_WINDOW)")
+    ap.add_argument("--latency", type=float, default=0.0, help="每次 Sheets 呼叫延遲 (秒)")
+    ap.add_argument("--quota", type=int, default=None, help="每分鐘 Sheets 呼叫上限，超過丟 429")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="隨機 503 的機率")
+    ap.add_argument("--timeout", type=float, default=60, help="AppTest 每次執行的逾時 (秒)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-memory", action="store_true", help="不量 tracemalloc 記憶體高峰")
+    ap.add_argument("--codec-only", action="store_true", help="只比較編碼大小與速度，不跑 app")
+    ap.add_argument("--json", help="結果另存 JSON")
+    ap.add_argument("--out", help="表格另存文字檔 (例如 bench_output.txt)")
+    args = ap.parse_args(argv)
+    # 在 app 外清共用資源時 streamlit 會一直警告沒有 ScriptRunContext，關掉
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+    cc = codec_check(generate(args.sessions, args.players, args.future, args.seed))
+    results = [] if args.codec_only else Bench(args).run()
+    text = render_codec(cc) + ("" if args.codec_only else "\n" + render(results, args))
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f: f.write(text + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump({"args": vars(args), "codec": cc, "results": results}, f, ensure_ascii=False, indent=2)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
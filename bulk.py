@@ -0,0 +1,173 @@
+import base64
+import copy
+import csv
+import hashlib
+import io
+import json
+import re
+import time
+from datetime import date, timedelta
+
+import codec
+import mutations
+import storage
+
+# ==========================================
+# 管理員批次作業：週期排程、匯入 / 匯出、多選刪除 / 隱藏。
+# 每種作業先轉成一串異動 (見 mutations.py)，再包成一筆 "bulk" 異動送進寫入佇列，整批只花一次讀 + 一次寫；
+# 送出前用 preview() 在資料副本上先套用一次，diff() 列出會改到哪些東西給管理員確認。不依賴 streamlit。
+# 匯出只含近期場次 (歸檔不在 data 裡)；CSV 的欄位跟 Sheets 工作表相同 (storage.TABS)，每列第一欄標明是哪張表
+# ==========================================
+EXPORT_TABS = ["sessions", "players", "leaves"]
+WEEKDAYS = ["一", "二", "三", "四", "五", "六", "日"]
+
+
+def schedule(start, end, weekdays, skip=()):
+    # start ~ end (含) 之間星期落在 weekdays (0 是週一) 的日期，跳過 skip
+    skip, out, d = {str(x) for x in skip}, [], start
+    while d <= end:
+        if d.weekday() in weekdays and str(d) not in skip: out.append(str(d))
+        d += timedelta(days=1)
+    return out
+
+
+def parse_dates(text):
+    # 逗號 / 頓號 / 空白 / 換行分隔的 YYYY-MM-DD；格式不對丟 ValueError
+    return [str(date.fromisoformat(t)) for t in re.split(r"[\s,，、]+", text.strip()) if t]
+
+
+def _portable(data):
+    return {"sessions": {d: data["sessions"][d] for d in sorted(data["sessions"])},
+            "hidden": sorted(data.get("hidden", [])), "leaves": data.get("leaves", {})}
+
+
+def export_json(data):
+    return json.dumps(_portable(data), ensure_ascii=False, indent=1)
+
+
+def export_csv(data):
+    rows = storage.flatten(_portable(data))
+    f = io.StringIO()
+    w = csv.writer(f)
+    for t in EXPORT_TABS:
+        w.writerow(["#" + t] + storage.TABS[t])
+        for k in sorted(rows[t]) if t == "leaves" else rows[t]: w.writerow([t] + rows[t][k])
+    return f.getvalue()
+
+
+FLAGS = ["isMember", "bringBall", "occupyCourt"]
+
+
+def _player(d, p):
+    # 一筆報名轉成跟 storage.unflatten 一樣的型別 (JSON 匯入檔什麼都可能有)，不合理的值丟 ValueError
+    if not isinstance(p, dict) or not p.get("name"): raise ValueError(f"{d} 有一筆報名沒有姓名")
+    who = f"{d}「{p['name']}」"
+    for k in ("name", "id", "owner"):
+        if not isinstance(p.get(k, ""), str): raise ValueError(f"{who} 的 {k} 要是文字")
+    if str(p.get("count", 1)).strip() not in ("0", "1"): raise ValueError(f"{who} 的 count 只能是 0 或 1")
+    p["count"] = int(str(p.get("count", 1)).strip())
+    for k in FLAGS:
+        v = p.get(k, False)
+        if v not in (True, False, "", "0", "1"): raise ValueError(f"{who} 的 {k} 要是 true / false")
+        p[k] = v not in (False, "", "0")
+    try: p["timestamp"] = float(p.get("timestamp") or 0)
+    except (TypeError, ValueError): raise ValueError(f"{who} 的 timestamp 要是數字") from None
+    return p
+
+
+def _check(data):
+    # 匯入檔的共同檢查：日期格式、每筆報名要有姓名且欄位型別正確；缺 id / timestamp 的補上 (依檔案順序排)
+    ts = time.time()
+    for d, pl in data["sessions"].items():
+        date.fromisoformat(d)
+        if not isinstance(pl, list): raise ValueError(f"{d} 的名單格式不對")
+        for p in pl:
+            _player(d, p)
+            if not p.get("id"): p["id"] = codec.new_id()
+            if not p["timestamp"]: p["timestamp"], ts = ts, ts + 0.01
+    for n, mons in data["leaves"].items():
+        if not isinstance(mons, list) or not all(isinstance(m, str) for m in mons): raise ValueError(f"{n} 的請假月份格式不對")
+        for m in mons: date.fromisoformat(m + "-01")
+    return data
+
+
+def load_file(name, raw):
+    # 讀匯入檔 (.json 或 .csv，格式同匯出)，回傳 {"sessions", "hidden", "leaves"}；看不懂丟 ValueError
+    text = raw.decode("utf-8-sig")
+    if name.lower().endswith(".json"):
+        obj = json.loads(text)
+        if not isinstance(obj, dict) or not isinstance(obj.get("sessions", {}), dict): raise ValueError("JSON 最外層要是 {\"sessions\": ...}")
+        return _check(_portable(storage.normalize(obj)))
+    rows = {t: {} for t in storage.TABS}
+    for r in csv.reader(io.StringIO(text)):
+        if not r or not r[0] or r[0].startswith("#"): continue
+        t, r = r[0], r[1:]
+        if t not in EXPORT_TABS: raise ValueError(f"不認得的表：{t}")
+        r = (r + [""] * len(storage.TABS[t]))[:len(storage.TABS[t])]
+        if t == "players" and not r[0]: r[0] = codec.new_id()
+        rows[t][storage._key(t, r)] = r
+    return _check(_portable(storage.unflatten(rows)))
+
+
+def _copy_id(pid, d):
+    # 複製到另一個場次的報名用的新 id：由原 id + 日期決定，同一份檔案再匯入一次會得到同一個 id (就會被略過)
+    return base64.urlsafe_b64encode(hashlib.sha1(f"{d}/{pid}".encode()).digest()[:9]).decode()
+
+
+def _reid(players, seen, d):
+    # 同一個 id 已經在別的場次 (現有資料或檔案前面) 出現過就換成 _copy_id，同場次的 owner 一起改；
+    # players 工作表以 id 為主鍵，不換的話存檔時只會留下一筆
+    remap = {p["id"]: _copy_id(p["id"], d) for p in players if p["id"] in seen}
+    for p in players: seen[remap.get(p["id"], p["id"])] = d
+    if not remap: return players
+    out = []
+    for p in players:
+        q = dict(p, id=remap.get(p["id"], p["id"]))
+        if "owner" in q: q["owner"] = remap.get(q["owner"], q["owner"])
+        out.append(q)
+    return out
+
+
+def import_ops(cur, inc):
+    # 匯入只會新增：沒有的場次、沒有的報名 (同場次同 id 算已經有)、沒有的假單、要隱藏的場次；不刪也不覆蓋現有資料
+    muts, seen = [], {p["id"]: d for d, pl in cur["sessions"].items() for p in pl}
+    for d in sorted(inc["sessions"]):
+        if d not in cur["sessions"]: muts.append(mutations.make("add_session", d=d))
+        new = [p for p in inc["sessions"][d] if d not in (seen.get(p["id"]), seen.get(_copy_id(p["id"], d)))]
+        new = _reid(list({p["id"]: p for p in new}.values()), seen, d)
+        if new: muts.append(mutations.make("import_players", d=d, players=new))
+    hide = [d for d in inc["hidden"] if d not in cur["hidden"]]
+    if hide: muts.append(mutations.make("hide_sessions", dates=hide))
+    for n in sorted(inc["leaves"]):
+        for m in sorted(inc["leaves"][n]):
+            if m not in cur["leaves"].get(n, []): muts.append(mutations.make("add_leave", name=n, month=m))
+    return muts
+
+
+def preview(data, muts):
+    # 在副本上套用，回傳 (差異列表, 會被拒的 [(異動, 例外)])
+    after = copy.deepcopy(data)
+    res = mutations.apply_all(after, [mutations.make("bulk", muts=muts)])[0]
+    if isinstance(res, Exception): raise res
+    return diff(data, after), [(m, r) for m, r in zip(muts, res) if isinstance(r, Exception)]
+
+
+def diff(before, after):
+    rows = []
+    b, a = before["sessions"], after["sessions"]
+    for d in sorted(set(b) | set(a)):
+        if d not in a: rows.append(("🗑️ 刪除場次", d, f"{len(b[d])} 筆報名" if b[d] else "")); continue
+        if d not in b: rows.append(("➕ 新增場次", d, ""))
+        was, now = {p["id"] for p in b.get(d, [])}, {p["id"] for p in a[d]}
+        add = [p["name"] for p in a[d] if p["id"] not in was]
+        gone = [p["name"] for p in b.get(d, []) if p["id"] not in now]
+        if add: rows.append(("➕ 新增報名", d, f"{len(add)} 筆：" + "、".join(add)))
+        if gone: rows.append(("🗑️ 移除報名", d, f"{len(gone)} 筆：" + "、".join(gone)))
+    bh, ah = set(before["hidden"]), set(after["hidden"])
+    rows += [("🙈 隱藏", d, "") for d in sorted(ah - bh)]
+    rows += [("👀 取消隱藏", d, "") for d in sorted(bh - ah) if d in a]
+    bl = {(n, m) for n, ms in before["leaves"].items() for m in ms}
+    al = {(n, m) for n, ms in after["leaves"].items() for m in ms}
+    rows += [("🏖️ 新增假單", m, n) for n, m in sorted(al - bl)]
+    rows += [("🗑️ 刪除假單", m, n) for n, m in sorted(bl - al)]
+    return [{"變更": k, "日期": d, "內容": c} for k, d, c in rows]
@@ -0,0 +1,130 @@
+import base64
+import json
+import os
+import re
+import uuid
+import zlib
+
+# ==========================================
+# 精簡編碼：整場名單 / 整份資料要塞進單一儲存格時用 (歸檔場次、舊版 A1 格式)
+#   "j1:" + 精簡 JSON，"z1:" + zlib 壓縮後 base64；開頭是 "[" 或 "{" 的是舊版 json.dumps，照樣讀得出來
+# 第 1 版每位球員一個 list：[id, 姓名, 旗標, timestamp 差值, owner, 其他欄位]
+#   - UUID 格式的 id 存成 "~" + 16 bytes 的 base64 (36 -> 23 字)，其他 id 原樣
+#   - 旗標 bit：1 晴女、2 帶球、4 佔場、8 加油團 (count 0)；count 不是 0/1 時放進「其他欄位」
+#   - timestamp 以微秒整數記，跟前一位的差值 (第一位跟 0 比)，所以解回來的精度是 1 微秒
+#   - owner 指向同場次的人就存她在 list 裡的位置 (整數)，其他原樣；沒有 owner 欄位是 null
+# 尾巴是 null 的欄位會省略。
+# ==========================================
+VERSION = 1
+_UUID = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+_FLAGS = [("isMember", 1), ("bringBall", 2), ("occupyCourt", 4)]
+_CHEER = 8
+_KNOWN = {"id", "name", "count", "isMember", "bringBall", "occupyCourt", "timestamp", "owner"}
+
+
+def new_id():
+    # 新報名用的短 id：9 bytes 亂數 -> 12 字 (不含 = 號)，同一份資料裡撞號的機率可以忽略
+    return base64.urlsafe_b64encode(os.urandom(9)).decode()
+
+
+def _short(pid):
+    if _UUID.match(pid): return "~" + base64.urlsafe_b64encode(uuid.UUID(pid).bytes).decode().rstrip("=")
+    return "~" + pid if pid.startswith("~") else pid  # 本來就是 ~ 開頭的 id 多加一個 ~ 區分
+
+
+def _long(pid):
+    if pid.startswith("~~"): return pid[1:]
+    if pid.startswith("~"): return str(uuid.UUID(bytes=base64.urlsafe_b64decode(pid[1:] + "==")))
+    return pid
+
+
+def _us(ts):
+    return round(float(ts) * 1_000_000)
+
+
+def pack_players(players):
+    pos = {p["id"]: i for i, p in enumerate(players)}
+    rows, prev = [], 0
+    for p in players:
+        flags = sum(bit for k, bit in _FLAGS if p.get(k))
+        extra = {k: v for k, v in p.items() if k not in _KNOWN}
+        cnt = p.get("count", 1)
+        if cnt == 0: flags |= _CHEER
+        elif cnt != 1: extra["count"] = cnt
+        t = _us(p.get("timestamp", 0))
+        o = p.get("owner")
+        if isinstance(o, str): o = pos.get(o, o)
+        elif o is not None: extra["owner"], o = o, None  # 不是字串的 owner 不能跟位置混在一起
+        row = [_short(p["id"]), p["name"], flags, t - prev, o, extra or None]
+        while row[-1] is None: row.pop()
+        rows.append(row)
+        prev = t
+    return rows
+
+
+def unpack_players(rows):
+    out, prev = [], 0
+    for row in rows:
+        row = list(row) + [None] * (6 - len(row))
+        pid, name, flags, dt, o, extra = row
+        prev += dt or 0
+        p = {"id": _long(pid), "name": name, "count": 0 if flags & _CHEER else 1, "timestamp": prev / 1_000_000}
+        for k, bit in _FLAGS: p[k] = bool(flags & bit)
+        if extra: p.update(extra)
+        out.append(p)
+    for p, row in zip(out, rows):
+        if len(row) > 4 and row[4] is not None:
+            p["owner"] = out[row[4]]["id"] if isinstance(row[4], int) else row[4]
+    return out
+
+
+def _wrap(obj, compress):
+    s = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    if not compress: return f"j{VERSION}:" + s
+    return f"z{VERSION}:" + base64.b64encode(zlib.compress(s.encode("utf-8"), 9)).decode()
+
+
+def _unwrap(s):
+    # 回傳 (版本, 物件)；舊版 json 版本是 0
+    if s[:1] in "[{": return 0, json.loads(s)
+    tag, _, body = s.partition(":")
+    if tag[:1] == "z": body = zlib.decompress(base64.b64decode(body)).decode("utf-8")
+    elif tag[:1] != "j": raise ValueError(f"未知的編碼：{s[:8]}")
+    v = int(tag[1:])
+    if v > VERSION: raise ValueError(f"編碼版本 {v} 比程式新，請先更新程式")
+    return v, json.loads(body)
+
+
+def encode_players(players, compress=True):
+    return _wrap(pack_players(players), compress)
+
+
+def decode_players(s):
+    v, obj = _unwrap(s)
+    return obj if v == 0 else unpack_players(obj)
+
+
+def encode_data(data, compress=True):
+    # 整份資料 (舊版 A1 單格用)：場次名單用 pack_players，其他照原樣
+    return _wrap({"s": {d: pack_players(pl) for d, pl in data["sessions"].items()}, "h": data.get("hidden", []),
+                  "l": data.get("leaves", {}), "st": data.get("stats")}, compress)
+
+
+def decode_data(s):
+    v, obj = _unwrap(s)
+    if v == 0: return obj
+    data = {"sessions": {d: unpack_players(rows) for d, rows in obj["s"].items()}, "hidden": obj["h"], "leaves": obj["l"]}
+    if obj.get("st") is not None: data["stats"] = obj["st"]
+    return data
+
+
+def canonical(players):
+    # 編碼後解回來應該等於這個：timestamp 取到微秒、旗標轉 bool
+    out = []
+    for p in players:
+        q = dict(p)
+        q["timestamp"] = _us(p.get("timestamp", 0)) / 1_000_000
+        q["count"] = p.get("count", 1)
+        for k, _ in _FLAGS: q[k] = bool(p.get(k))
+        out.append(q)
+    return out
@@ -0,0 +1,106 @@
+import threading
+from bisect import bisect_left, insort
+
+from roster import norm_name
+
+# ==========================================
+# 假單索引：data["leaves"] 是 {登記時的姓名: [月份]}，同一人可能用不同大小寫 / 全形半形登記好幾次。
+# LeaveIndex 依正規化姓名 (roster.norm_name) 建索引，查「某人某月有沒有請假」、「某人請了哪些月」都是 O(1)，
+# 休假公報、出席報表、報名時的請假提醒共用；異動 (add_leave / remove_leave) 時逐筆增刪，不必整份重建。
+# 寫入佇列自己留一份 LeaveIndex 跨批次沿用 (見 mutations.apply_all)，每批開頭 sync 一下，只動有變的人。
+# ==========================================
+class LeaveIndex:
+    def __init__(self, leaves=None):
+        self.by_name = {}   # 正規化姓名 -> {月份: {原始姓名}}
+        self.shown = {}     # 正規化姓名 -> 顯示用姓名 (最早登記的寫法)
+        self.keys = []      # 排序好的正規化姓名，公報照這個順序列
+        self.src = {}
+        if leaves: self.sync(leaves)
+
+    def add(self, name, month):
+        k = norm_name(name)
+        if k not in self.by_name: self.by_name[k] = {}; self.shown[k] = name; insort(self.keys, k)
+        self.by_name[k].setdefault(month, set()).add(name)
+
+    def discard(self, name, month):
+        k = norm_name(name)
+        ms = self.by_name.get(k, {})
+        names = ms.get(month)
+        if not names or name not in names: return
+        names.discard(name)
+        if not names: del ms[month]
+        if not ms:
+            del self.by_name[k], self.shown[k]
+            del self.keys[bisect_left(self.keys, k)]
+        elif self.shown[k] == name and not any(name in s for s in ms.values()):
+            self.shown[k] = min(n for s in ms.values() for n in s)
+
+    def sync(self, leaves):
+        # 跟新一份 data["leaves"] 對齊：只對有變動的人做增刪，回傳動到的正規化姓名
+        touched = set()
+        for n in [x for x in self.src if x not in leaves] + list(leaves):
+            old, new = self.src.get(n, []), leaves.get(n, [])
+            if old is new or old == new: continue
+            for m in set(old) - set(new): self.discard(n, m)
+            for m in set(new) - set(old): self.add(n, m)
+            touched.add(norm_name(n))
+        self.src = leaves
+        return touched
+
+    # ---------- 查詢 (姓名會先正規化，傳原始姓名或正規化過的都可以) ----------
+    def on_leave(self, name, month):
+        return month in self.by_name.get(norm_name(name), ())
+
+    def months(self, name):
+        return sorted(self.by_name.get(norm_name(name), ()))
+
+    def entries(self, name, month=None):
+        # 這個人 (某月 / 全部) 的假單，回傳 [(原始姓名, 月份)]，刪除時用
+        ms = self.by_name.get(norm_name(name), {})
+        return [(n, m) for m in ([month] if month is not None else list(ms)) for n in ms.get(m, ())]
+
+    def people(self):
+        # [(正規化姓名, 顯示姓名, 月份)]，依正規化姓名排序
+        return [(k, self.shown[k], sorted(self.by_name[k])) for k in self.keys]
+
+
+class LeaveView:
+    # 唯讀的索引快照：LeaveCache 每次同步完建一份，查詢方法同 LeaveIndex；
+    # 交出去之後共用的 LeaveIndex 再被別的分頁同步也不會影響它。
+    # 有上一份 (prev) 時沿用它沒變的人，只重做 touched 這幾個人
+    def __init__(self, idx, prev=None, touched=None):
+        if prev is None: self.by_name, self.shown, self._rows, touched = {}, {}, {}, idx.by_name
+        else: self.by_name, self.shown, self._rows = dict(prev.by_name), dict(prev.shown), dict(prev._rows)
+        for k in touched:
+            if k in idx.by_name:
+                self.by_name[k], self.shown[k] = frozenset(idx.by_name[k]), idx.shown[k]
+                self._rows[k] = (k, self.shown[k], tuple(sorted(self.by_name[k])))
+            else:
+                for d in (self.by_name, self.shown, self._rows): d.pop(k, None)
+        same = prev is not None and all((k in prev.by_name) == (k in self.by_name) for k in touched)
+        self._keys = prev._keys if same else tuple(idx.keys)
+        self._people = None
+
+    def on_leave(self, name, month):
+        return month in self.by_name.get(norm_name(name), ())
+
+    def months(self, name):
+        return sorted(self.by_name.get(norm_name(name), ()))
+
+    def people(self):
+        if self._people is None: self._people = tuple(self._rows[k] for k in self._keys)
+        return self._people
+
+
+class LeaveCache:
+    # 跨分頁共用一份 LeaveIndex；快照換新時只同步有變動的人，再產生一份 LeaveView 給這個快照的所有讀者
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idx = LeaveIndex()
+        self.view = LeaveView(self.idx)
+
+    def get(self, leaves):
+        with self.lock:
+            if self.idx.src is not leaves:
+                self.view = LeaveView(self.idx, self.view, self.idx.sync(leaves))
+            return self.view
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+
+# ==========================================
+# 效能監測：整個程序共用一個環狀緩衝區 (最近 RING_SIZE 筆 span)，外加累計計數器。
+# 每次 rerun / fragment 重跑 / 寫入佇列 flush 算一個 run，期間的 span 都掛在同一個 run id 底下，
+# Sheets 的每次 API 呼叫由 SheetsProbe 記錄耗時與傳輸量。不依賴 streamlit，背景執行緒也能用。
+# ==========================================
+RING_SIZE = 5000
+_ring = deque(maxlen=RING_SIZE)
+_counters = Counter()
+_lock = threading.Lock()
+_local = threading.local()
+_started = time.time()
+
+
+def begin_run(kind):
+    _local.run = (uuid.uuid4().hex[:8], kind, time.time())
+
+
+def end_run():
+    r = getattr(_local, "run", None)
+    if r: _ring.append({"run": r[0], "kind": r[1], "name": "rerun", "t": r[2], "ms": (time.time() - r[2]) * 1000})
+    _local.run = None
+
+
+def begin_fragment():
+    # fragment 在整頁 rerun 裡執行時算在整頁那次；單獨重跑時自己開一個 run
+    r = getattr(_local, "run", None)
+    if r is None or r[1] != "page": begin_run("fragment")
+
+
+def _run():
+    if getattr(_local, "run", None) is None: begin_run("other")
+    return _local.run
+
+
+def count(name, n=1):
+    with _lock: _counters[name] += n
+
+
+@contextmanager
+def span(name, **tags):
+    r, t0 = _run(), time.time()
+    p0 = time.perf_counter()
+    try: yield tags
+    finally:
+        _ring.append({"run": r[0], "kind": r[1], "name": name, "t": t0, "ms": (time.perf_counter() - p0) * 1000, **tags})
+
+
+def timed(name):
+    def deco(fn):
+        @wraps(fn)
+        def inner(*a, **kw):
+            with span(name): return fn(*a, **kw)
+        return inner
+    return deco
+
+
+def _size(obj):
+    try: return len(json.dumps(obj, ensure_ascii=False).encode())
+    except (TypeError, ValueError): return 0
+
+
+class SheetsProbe:
+    # 包住 gspread 的 Spreadsheet：values_* / worksheets / add_worksheet 每次呼叫記一個 span (耗時、送出與收到的位元組)
+    CALLS = {"values_get", "values_batch_get", "values_update", "values_batch_update", "values_append",
+             "worksheets", "add_worksheet", "batch_update"}
+
+    def __init__(self, ss):
+        self._ss = ss
+
+    def __getattr__(self, name):
+        attr = getattr(self._ss, name)
+        if name not in self.CALLS: return attr
+
+        def call(*a, **kw):
+            body = kw.get("body") or (a[0] if name == "values_batch_update" and a else None)
+            with span(f"sheets.{name}") as tags:
+                count(f"sheets.{name}")
+                try: res = attr(*a, **kw)
+                except Exception:
+                    count("sheets.errors"); tags["error"] = True; raise
+                if body is not None: tags["out"] = _size(body); count("sheets.bytes_out", tags["out"])
+                if isinstance(res, dict): tags["in"] = _size(res); count("sheets.bytes_in", tags["in"])
+                return res
+        return call
+
+
+def _pct(xs, q):
+    return xs[min(len(xs) - 1, int(round(q * (len(xs) - 1))))] if xs else 0.0
+
+
+def summary():
+    # 依名稱彙總環狀緩衝區裡的 span
+    by = {}
+    for s in list(_ring): by.setdefault(s["name"], []).append(s)
+    rows = []
+    for name, ss in sorted(by.items()):
+        ms = sorted(s["ms"] for s in ss)
+        rows.append({"名稱": name, "次數": len(ms), "平均ms": round(sum(ms) / len(ms), 1), "p50ms": round(_pct(ms, 0.5), 1),
+                     "p95ms": round(_pct(ms, 0.95), 1), "最大ms": round(ms[-1], 1),
+                     "KB": round(sum(s.get("in", 0) + s.get("out", 0) for s in ss) / 1024, 1)})
+    return rows
+
+
+def runs(limit=20):
+    # 最近幾次 run：總耗時 (有 end_run 就用它，否則取第一個 span 開始到最後一個結束)、Sheets 呼叫數
+    by = {}
+    for s in list(_ring): by.setdefault(s["run"], []).append(s)
+    out = []
+    for rid, ss in by.items():
+        tot = next((s["ms"] for s in ss if s["name"] == "rerun"), None)
+        if tot is None: tot = (max(s["t"] + s["ms"] / 1000 for s in ss) - min(s["t"] for s in ss)) * 1000
+        slow = max((s for s in ss if s["name"] != "rerun"), key=lambda s: s["ms"], default=None)
+        out.append({"run": rid, "類型": ss[0]["kind"], "開始": time.strftime("%H:%M:%S", time.localtime(min(s["t"] for s in ss))),
+                    "_t": min(s["t"] for s in ss), "總ms": round(tot, 1),
+                    "Sheets": sum(1 for s in ss if s["name"].startswith("sheets.")),
+                    "最慢": f"{slow['name']} {slow['ms']:.0f}ms" if slow else ""})
+    out.sort(key=lambda r: r["_t"], reverse=True)
+    for r in out: del r["_t"]
+    return out[:limit]
+
+
+def counters():
+    with _lock: return dict(_counters)
+
+
+def export(**extra):
+    return json.dumps({"since": _started, "exported": time.time(), "ring_size": RING_SIZE, "counters": counters(),
+                       "summary": summary(), "spans": list(_ring), **extra}, ensure_ascii=False, indent=1)
+
+
+def reset():
+    global _started
+    _ring.clear()
+    with _lock: _counters.clear()
+    _started = time.time()
@@ -0,0 +1,238 @@
+import re
+
+import stats
+from leaves import LeaveIndex
+from roster import NameIndex, RosterEngine, is_friend, norm_name
+
+# ==========================================
+# 所有寫入都表示成一個小 dict：{"op": 名稱, ...參數}
+# apply_all() 直接在資料副本上依序套用一批；版本衝突時會在最新資料上整批重新套用，
+# 所以檢查一律寫在 op 裡 (不能只在畫面上先算好)，報名的 timestamp 在送出當下就決定，重放也不會改變順序。
+# 寫入佇列當機重啟時可能把同一筆再套一次，所以每個 op 重複套用都不能多出資料 (報名靠送出時就決定的 ids 判斷)
+# ==========================================
+class Rejected(Exception):
+    pass
+
+
+class Batch:
+    # 同一批異動共用的姓名索引 / 假單索引：第一次用到時建一次，之後的增刪同步更新
+    # leaves / names：呼叫端跨批次沿用的 LeaveIndex 與 {場次: NameIndex} (寫入佇列那份)，用到時只 sync 有變的人；沒給才整份現建
+    def __init__(self, data, leaves=None, names=None):
+        self.data = data
+        self._names = {}
+        self._keep_names = names
+        self._keep = leaves
+        self._leaves = None
+
+    def session(self, d):
+        if d not in self.data["sessions"]: raise Rejected("場次已不存在")
+        return self.data["sessions"][d]
+
+    def names(self, d):
+        if d not in self._names:
+            if self._keep_names is None: self._names[d] = NameIndex(self.session(d))
+            else:
+                idx = self._keep_names.setdefault(d, NameIndex())
+                idx.sync(self.session(d))
+                self._names[d] = idx
+        return self._names[d]
+
+    def drop(self, d):
+        self._names.pop(d, None)
+        if self._keep_names is not None: self._keep_names.pop(d, None)
+
+    def leaves(self):
+        if self._leaves is None:
+            if self._keep is None: self._leaves = LeaveIndex(self.data["leaves"])
+            else: self._keep.sync(self.data["leaves"]); self._leaves = self._keep
+        return self._leaves
+
+
+def _legacy_friend(p, tn):
+    return p['name'].startswith(f"{tn} (友") or p['name'].startswith(f"{tn} （友") or p['name'] == f"{tn}之友"
+
+
+def _friends(ctx, d, mid):
+    # 團員帶來的朋友：看 owner；團員本人還沒連結 owner (舊資料) 時，沒有 owner 的朋友照姓名比對
+    target, ids = ctx.names(d).get(mid), set(ctx.names(d).friends(mid))
+    if 'owner' not in target: ids |= {p['id'] for p in ctx.session(d) if 'owner' not in p and _legacy_friend(p, target['name'])}
+    return ids
+
+
+def add_regs(ctx, d, name, im, bb, oc, ev, tot, ts, ids):
+    if "友" in name: raise Rejected("請輸入『團員姓名』並使用下方『報名人數』來幫朋友報名。")
+    cur_p, idx = ctx.session(d), ctx.names(d)
+    if idx.get(ids[0]): return ids
+    mid = idx.member(name)
+    num_rel = 1 + len(_friends(ctx, d, mid)) if mid else 0
+    if num_rel == 0 and not im: raise Rejected("第一次報名需勾選「⭐晴女」")
+    if num_rel > 0 and im: raise Rejected("加報朋友請勿重複勾選晴女")
+    if num_rel + tot > 3: raise Rejected("每人上限 3 位")
+    owner = mid or ids[0]
+    base = idx.get(mid)['name'] if mid else name
+    for k in range(tot):
+        is_m = (k == 0 and num_rel == 0)
+        fn = name if is_m else f"{base} (友{num_rel+k})"
+        p = {"id": ids[k], "name": fn, "count": (0 if ev and is_m else 1), "isMember": (im if is_m else False),
+             "bringBall": (bb if is_m else False), "occupyCourt": (oc if is_m else False), "timestamp": ts + (k*0.01), "owner": owner}
+        cur_p.append(p); idx.add(p); stats.attend(ctx.data, d, p)
+    return ids
+
+
+def update_player(ctx, d, pid, name, im, bb, oc, iv):
+    t = ctx.names(d).get(pid)
+    if not t: raise Rejected("找不到這筆報名")
+    final_im = False if is_friend(t) else im
+    stats.attend(ctx.data, d, t, -1)
+    t.update({'name': name, 'isMember': final_im, 'bringBall': bb, 'occupyCourt': oc, 'count': 0 if iv else 1})
+    stats.attend(ctx.data, d, t)
+    return True
+
+
+def delete_player(ctx, d, pid):
+    pl, idx = ctx.session(d), ctx.names(d)
+    target = idx.get(pid)
+    if not target: raise Rejected("找不到這筆報名")
+    drop = {pid}
+    if not is_friend(target): drop |= _friends(ctx, d, pid)
+    ctx.data["sessions"][d] = [p for p in pl if p['id'] not in drop]
+    for x in drop: stats.attend(ctx.data, d, idx.get(x), -1); idx.remove(x)
+    return True
+
+
+def promote(ctx, d, wid, cap):
+    eng = RosterEngine(cap, ctx.session(d))
+    if wid not in eng.by_id: raise Rejected("無可遞補對象")
+    if eng.is_main(wid): return True
+    w, tg = eng.by_id[wid], eng.promotion_candidate()
+    if not tg: raise Rejected("無可遞補對象")
+    cutoff = eng.cutoff()
+    w['timestamp'] = tg['timestamp'] - 1.0
+    tg['timestamp'] = cutoff + 1.0
+    return True
+
+
+def add_leave(ctx, name, month):
+    # 同一人 (正規化姓名相同) 同月已經請過就不重複登記
+    idx = ctx.leaves()
+    if idx.on_leave(name, month): return True
+    ctx.data["leaves"].setdefault(name, []).append(month)
+    idx.add(name, month)
+    return True
+
+
+def remove_leave(ctx, low_n, month=None):
+    # month 為 None 時整個人的假單都刪掉；low_n 是正規化姓名 (不分大小寫、全形半形)，同一人的各種寫法一起刪
+    leaves, idx = ctx.data["leaves"], ctx.leaves()
+    for n, m in idx.entries(low_n, month):
+        leaves[n].remove(m)
+        if not leaves[n]: del leaves[n]
+        idx.discard(n, m)
+    return True
+
+
+def add_session(ctx, d):
+    ctx.data["sessions"].setdefault(d, [])
+    return True
+
+
+def delete_session(ctx, d):
+    for p in ctx.data["sessions"].pop(d, []): stats.attend(ctx.data, d, p, -1)
+    ctx.data["hidden"] = [x for x in ctx.data["hidden"] if x != d]
+    ctx.drop(d)
+    return True
+
+
+def import_players(ctx, d, players):
+    # 匯入整批報名：id / timestamp / owner 照檔案原樣，不套報名規則；已經有的 id 略過
+    pl, idx, n = ctx.session(d), ctx.names(d), 0
+    for p in players:
+        if idx.get(p['id']): continue
+        p = dict(p)
+        pl.append(p); idx.add(p); stats.attend(ctx.data, d, p)
+        n += 1
+    return n
+
+
+def hide_sessions(ctx, dates, hidden=True):
+    # 只動 dates 這幾場的隱藏狀態 (set_hidden 是整份覆蓋)
+    keep = [x for x in ctx.data["hidden"] if x not in dates]
+    ctx.data["hidden"] = keep + [x for x in dict.fromkeys(dates) if x in ctx.data["sessions"]] if hidden else keep
+    return True
+
+
+def set_hidden(ctx, dates):
+    ctx.data["hidden"] = list(dates)
+    return True
+
+
+def clean_member_flags(ctx):
+    count = 0
+    for d in ctx.data["sessions"]:
+        idx = ctx.names(d)
+        for fid in idx.all_friends():
+            p = idx.get(fid)
+            if p.get('isMember'):
+                p['isMember'] = False
+                count += 1
+    return count
+
+
+_FRIEND_RE = re.compile(r"^(.*?)\s*(?:[(（]友\d*[)）]?|之友)$")
+
+
+def link_owners(ctx):
+    # 補舊資料的 owner：團員指向自己，朋友依「X (友1)」「X （友1)」「X之友」找回同場次的團員 X (找不到就留空字串)
+    count = 0
+    for d, pl in ctx.data["sessions"].items():
+        members = {norm_name(p['name']): p['id'] for p in pl if "友" not in p['name']}
+        for p in pl:
+            if 'owner' in p: continue
+            if "友" not in p['name']: p['owner'] = p['id']
+            else:
+                m = _FRIEND_RE.match(p['name'])
+                p['owner'] = members.get(norm_name(m.group(1)), "") if m else ""
+            count += 1
+        ctx.drop(d)
+    return count
+
+
+def rollover_stats(ctx, today):
+    return stats.rollover(ctx.data, today)
+
+
+def bulk(ctx, muts):
+    # 管理員批次作業 (見 bulk.py)：一串異動包成一筆，同一次 commit 寫入；各筆結果依序回傳，被拒的不影響其他筆
+    return _apply(ctx, muts)
+
+
+def rebuild_stats(ctx, today, base=None):
+    # base 是歸檔場次的重算結果 (歸檔不在 data 裡，由呼叫端先算好帶進來)
+    ctx.data["stats"] = {"through": today, "members": stats.rebuild(ctx.data["sessions"], today, base)}
+    return len(ctx.data["stats"]["members"])
+
+
+OPS = {f.__name__: f for f in [add_regs, update_player, delete_player, promote, add_leave, remove_leave,
+                                add_session, delete_session, import_players, hide_sessions, set_hidden, clean_member_flags, link_owners,
+                                rollover_stats, rebuild_stats, bulk]}
+
+
+def make(op, **kw):
+    return {"op": op, **kw}
+
+
+def _apply(ctx, muts):
+    results = []
+    for m in muts:
+        kw = {k: v for k, v in m.items() if k != "op"}
+        try: results.append(OPS[m["op"]](ctx, **kw))
+        except Exception as e: results.append(e)
+    return results
+
+
+def apply_all(data, muts, leaves=None, names=None):
+    # 單筆被拒 (Rejected) 不影響同批其他筆，結果依序回傳 (例外物件也放在對應位置)
+    # leaves / names 只能給同一個執行緒依序使用 (寫入佇列)，見 Batch；已經不在資料裡 (歸檔 / 刪除) 的場次順便丟掉
+    if names is not None:
+        for d in [x for x in names if x not in data["sessions"]]: del names[d]
+    return _apply(Batch(data, leaves, names), muts)
@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+
+import gspread
+import requests
+
+import metrics
+from storage import StorageUnavailable
+
+# ==========================================
+# Sheets 配額保護：Google 的限制是每個帳號每分鐘讀 / 寫各有上限，超過就回 429。
+# Throttled 包住 Spreadsheet，每次 API 呼叫先向 token bucket 拿額度 (讀寫分開，整個程序共用，所有分頁一起排隊)，
+# 遇到 429 / 5xx / 連線錯誤用指數退避加隨機抖動重試；重試用完丟 StorageUnavailable，讓呼叫端知道是「讀不到」不是「沒資料」。
+# ==========================================
+READS = {"values_get", "values_batch_get", "worksheets"}
+WRITES = {"values_update", "values_batch_update", "values_append", "add_worksheet", "batch_update"}
+
+
+class TokenBucket:
+    # 每分鐘 per_min 個額度，最多累積 burst 個；額度不夠時先預約再睡，先到的先用
+    def __init__(self, per_min, burst=None, max_wait=10.0):
+        self.rate = per_min / 60.0
+        self.cap = burst or max(1, per_min // 6)
+        self.max_wait = max_wait
+        self.tokens = float(self.cap)
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.cap, self.tokens + (now - self.t) * self.rate)
+            self.t = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if wait > self.max_wait: raise StorageUnavailable("Google Sheets 配額已滿，請稍後再試")
+            self.tokens -= 1
+        if wait: time.sleep(wait)
+        return wait
+
+    def drain(self):
+        # 收到 429 表示 Google 那邊已經滿了，大家一起停一下
+        with self.lock: self.tokens = min(self.tokens, 0.0)
+
+
+def retryable(e):
+    if isinstance(e, gspread.exceptions.APIError):
+        code = getattr(e.response, "status_code", None) or e.code
+        return code == 429 or code >= 500
+    return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class Throttled:
+    def __init__(self, ss, reads, writes, retries=4, base=0.5, cap=8.0):
+        self._ss, self._reads, self._writes = ss, reads, writes
+        self.retries, self.base, self.cap = retries, base, cap
+
+    def __getattr__(self, name):
+        attr = getattr(self._ss, name)
+        bucket = self._reads if name in READS else self._writes if name in WRITES else None
+        if bucket is None: return attr
+
+        def call(*a, **kw):
+            for attempt in range(self.retries + 1):
+                waited = bucket.acquire()
+                if waited: metrics.count("quota.wait_ms", int(waited * 1000))
+                try: return attr(*a, **kw)
+                except Exception as e:
+                    if not retryable(e): raise
+                    if attempt == self.retries: raise StorageUnavailable(f"Google Sheets 暫時無法使用：{e}") from e
+                    if getattr(e, "code", None) == 429: bucket.drain()
+                    metrics.count("quota.retries")
+                    time.sleep(random.uniform(0, min(self.cap, self.base * 2 ** attempt)) + self.base / 2)
+        return call
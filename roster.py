@@ -0,0 +1,199 @@
+import heapq
+import threading
+from collections import namedtuple
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+# ==========================================
+# 正選 / 候補計算：依 timestamp 先到先排，佔名額的人 (count 1) 前 capacity 位是正選，
+# 加油團 (count 0) 不佔名額、一律算正選。報名時 count 只會是 0 或 1，所以正選就是「佔名額者的前 capacity 名」，
+# 用排序好的 key 清單 + bisect 就能查排名，帶球 / 佔場人數隨增刪即時調整，不必每次整份重排。
+# NameIndex 則是報名 / 刪除時找團員與她的朋友用 (看 owner 欄位，不再比對姓名字串)。
+# 不依賴 streamlit，可以直接拿來寫測試。
+# ==========================================
+def _k(p):
+    return (p.get('timestamp', 0), p['id'])
+
+
+def norm_name(n):
+    # 比對姓名用：全形半形統一 (NFKC) + 不分大小寫
+    return unicodedata.normalize("NFKC", n).casefold().strip()
+
+
+def is_friend(p):
+    # 朋友的 owner 指向帶她來的團員那筆報名；團員本人 owner 就是自己。還沒連結過的舊資料才看姓名
+    if 'owner' in p: return p['owner'] != p['id']
+    return "友" in p['name']
+
+
+class NameIndex:
+    # 單一場次的姓名索引：正規化姓名 -> 團員報名 id，團員 id -> 她的朋友們
+    # 寫入佇列跨批次沿用同一份 (見 mutations.apply_all)，每批開頭 sync 一下，只重排姓名 / owner 有變的人
+    def __init__(self, players=()):
+        self.by_id = {}
+        self.members = {}
+        self.friends_of = {}
+        self._at = {}  # id -> 加進索引時的 (姓名, owner, 放在哪)，sync 與 remove 用，不必再正規化一次姓名
+        self._dup = set()  # 可能對錯筆的姓名 (兩筆團員報名正規化後同名、對到的那筆被刪)，下次 sync 照名單順序重新決定
+        for p in players: self.add(p)
+
+    def add(self, p):
+        pid = p['id']
+        self.by_id[pid] = p
+        if is_friend(p): slot = (True, p.get('owner')); self.friends_of.setdefault(slot[1], set()).add(pid)
+        else:
+            slot = (False, norm_name(p['name']))
+            if self.members.setdefault(slot[1], pid) != pid: self._dup.add(slot[1])
+        self._at[pid] = (p['name'], p.get('owner'), slot)
+
+    def remove(self, pid):
+        del self.by_id[pid]
+        friend, k = self._at.pop(pid)[2]
+        if friend: self.friends_of.get(k, set()).discard(pid)
+        elif self.members.get(k) == pid: del self.members[k]; self._dup.add(k)
+
+    def sync(self, players):
+        # 跟新一份名單對齊 (每批的資料都是新複本)：姓名 / owner 沒變的只換成新的 dict，有變的才重新加入
+        seen = set()
+        for p in players:
+            pid = p['id']
+            seen.add(pid)
+            at = self._at.get(pid)
+            if at is not None and at[0] == p['name'] and at[1] == p.get('owner'): self.by_id[pid] = p; continue
+            if at is not None: self.remove(pid)
+            self.add(p)
+        for pid in [x for x in self.by_id if x not in seen]: self.remove(pid)
+        if self._dup:
+            # 跟整份重建一樣：同名的團員對到名單上最前面那筆
+            first = {}
+            for p in players:
+                friend, k = self._at[p['id']][2]
+                if not friend and k in self._dup: first.setdefault(k, p['id'])
+            for k in self._dup:
+                if k in first: self.members[k] = first[k]
+                else: self.members.pop(k, None)
+            self._dup = set()
+
+    def get(self, pid):
+        return self.by_id.get(pid)
+
+    def member(self, name):
+        return self.members.get(norm_name(name))
+
+    def friends(self, owner):
+        return self.friends_of.get(owner, set())
+
+    def all_friends(self):
+        return [pid for ids in self.friends_of.values() for pid in ids]
+
+
+class RosterEngine:
+    def __init__(self, capacity, players=()):
+        self.cap = capacity
+        self.by_id = {p['id']: p for p in players}
+        ps = self.by_id.values()
+        self._keys = sorted(_k(p) for p in ps if p.get('count', 1) > 0)
+        self._cheer = sorted(_k(p) for p in ps if p.get('count', 1) == 0)
+        self._friends = sorted(_k(p) for p in ps if p.get('count', 1) > 0 and is_friend(p))
+        self.balls = self.courts = 0
+        for key in self._keys[:self.cap] + self._cheer: self._flags(self.by_id[key[1]], 1)
+        self.src = None  # RosterCache 用來判斷是不是同一份名單
+
+    def _flags(self, p, sign):
+        if p.get('bringBall'): self.balls += sign
+        if p.get('occupyCourt'): self.courts += sign
+
+    # ---------- 增刪 ----------
+    def add(self, p):
+        self.by_id[p['id']] = p
+        key = _k(p)
+        if p.get('count', 1) == 0:
+            insort(self._cheer, key); self._flags(p, 1); return
+        if is_friend(p): insort(self._friends, key)
+        r = bisect_left(self._keys, key)
+        self._keys.insert(r, key)
+        if r < self.cap:
+            self._flags(p, 1)
+            if len(self._keys) > self.cap: self._flags(self.by_id[self._keys[self.cap][1]], -1)  # 被擠到候補
+
+    def remove(self, pid):
+        p = self.by_id.pop(pid)
+        key = _k(p)
+        if p.get('count', 1) == 0:
+            self._cheer.pop(bisect_left(self._cheer, key)); self._flags(p, -1); return
+        if is_friend(p): self._friends.pop(bisect_left(self._friends, key))
+        r = bisect_left(self._keys, key)
+        self._keys.pop(r)
+        if r < self.cap:
+            self._flags(p, -1)
+            if len(self._keys) >= self.cap: self._flags(self.by_id[self._keys[self.cap - 1][1]], 1)  # 候補第一位補上
+
+    def update(self, p):
+        self.remove(p['id']); self.add(p)
+
+    def sync(self, players):
+        # 跟新一份名單對齊：只對有變動的人做增刪
+        seen = set()
+        for p in players:
+            seen.add(p['id'])
+            old = self.by_id.get(p['id'])
+            if old is None: self.add(p)
+            elif old is not p and old != p: self.update(p)
+            else: self.by_id[p['id']] = p
+        for pid in [x for x in self.by_id if x not in seen]: self.remove(pid)
+        self.src = players
+
+    # ---------- 查詢 ----------
+    @property
+    def main_count(self):
+        return min(len(self._keys), self.cap)
+
+    @property
+    def wait_count(self):
+        return max(0, len(self._keys) - self.cap)
+
+    def is_main(self, pid):
+        p = self.by_id[pid]
+        return p.get('count', 1) == 0 or bisect_left(self._keys, _k(p)) < self.cap
+
+    def main(self):
+        return [self.by_id[k[1]] for k in heapq.merge(self._keys[:self.cap], self._cheer)]
+
+    def wait(self):
+        return [self.by_id[k[1]] for k in self._keys[self.cap:]]
+
+    def cutoff(self):
+        # 正選最後一位的 timestamp
+        last = [ks[-1][0] for ks in (self._keys[:self.cap], self._cheer) if ks]
+        return max(last) if last else None
+
+    def promotion_candidate(self):
+        # 正選中最晚報名的朋友，候補的晴女可以跟她交換
+        if not self._keys: return None
+        i = bisect_right(self._friends, self._keys[self.main_count - 1]) - 1
+        return self.by_id[self._friends[i][1]] if i >= 0 else None
+
+
+# 某一刻的正選 / 候補結果 (list 都是新建的)，離開 RosterCache 的鎖之後別的分頁再同步也不會影響它
+RosterView = namedtuple("RosterView", "main wait main_count wait_count balls courts candidate")
+
+
+class RosterCache:
+    # 每個場次一個 RosterEngine，跨分頁共用；快照換新時只同步有變動的人
+    # engine 本身會被別的分頁同步改動，所以 get() 在鎖裡把結果算好，回傳 RosterView
+    def __init__(self, capacity):
+        self.cap = capacity
+        self.lock = threading.Lock()
+        self.engines = {}
+
+    def get(self, d, players):
+        with self.lock:
+            eng = self.engines.get(d)
+            if eng is None: eng = self.engines[d] = RosterEngine(self.cap, players)
+            if eng.src is not players: eng.sync(players)
+            return RosterView(eng.main(), eng.wait(), eng.main_count, eng.wait_count, eng.balls, eng.courts,
+                              eng.promotion_candidate())
+
+    def prune(self, dates):
+        with self.lock:
+            for d in [x for x in self.engines if x not in dates]: del self.engines[d]
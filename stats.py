@@ -0,0 +1,93 @@
+import copy
+from datetime import date
+
+from leaves import LeaveIndex
+from roster import is_friend, norm_name
+
+# ==========================================
+# 出席統計 (物化表)：data["stats"] = {"through": 已結算到哪一天, "members": {正規化姓名: {"name", "dates"}}}
+# 日期 <= through 的場次才算出席；寫入異動時順手增減，跨過今天的場次等報表要用時才補結算 (rollover)，
+# 所以產生報表不必再掃全部歷史場次。rebuild() 從頭重算 (含歸檔場次)，用來比對物化表有沒有算錯。
+# ==========================================
+def empty_stats():
+    return {"through": "", "members": {}}
+
+
+def _members(data):
+    return data.setdefault("stats", empty_stats())["members"]
+
+
+def counts(data, d):
+    # 這個場次已經結算過 (出席有算進統計)
+    return d <= data.get("stats", empty_stats())["through"]
+
+
+def attend(data, d, p, sign=1):
+    if is_friend(p) or not counts(data, d): return
+    ms = _members(data)
+    k = norm_name(p['name'])
+    m = ms.setdefault(k, {"name": p['name'], "dates": []})
+    if sign > 0:
+        if d not in m["dates"]: m["dates"].append(d); m["dates"].sort()
+        if d >= m["dates"][-1]: m["name"] = p['name']
+    else:
+        if d in m["dates"]: m["dates"].remove(d)
+        if not m["dates"]: del ms[k]
+
+
+def _fold(sessions, members):
+    for d in sorted(sessions):
+        for p in sessions[d]:
+            if is_friend(p): continue
+            m = members.setdefault(norm_name(p['name']), {"name": p['name'], "dates": []})
+            if d not in m["dates"]: m["dates"].append(d)
+            m["name"] = p['name']
+
+
+def rollover(data, today):
+    # 把 (through, today] 之間的場次補進統計
+    st = data.setdefault("stats", empty_stats())
+    if st["through"] >= today: return 0
+    todo = {d: pl for d, pl in data["sessions"].items() if st["through"] < d <= today}
+    _fold(todo, st["members"])
+    st["through"] = today
+    return len(todo)
+
+
+def rebuild(sessions, today, base=None):
+    # base：已經從歸檔場次算好的部分，這裡再疊上 sessions
+    members = copy.deepcopy(base) if base else {}
+    _fold({d: pl for d, pl in sessions.items() if d <= today}, members)
+    return members
+
+
+def report(data, today=None, leaves=None):
+    # leaves：已經建好的 LeaveIndex / LeaveView (app 跨分頁共用那份)，沒給就現建
+    today = today or date.today()
+    ms = data.get("stats", empty_stats())["members"]
+    li = leaves or LeaveIndex(data["leaves"])
+    rep = []
+    curr_m = today.strftime("%Y-%m")
+    for k in sorted(set(ms) | set(li.by_name)):
+        m = ms.get(k)
+        name = m["name"] if m else li.shown[k]
+        ld = date.fromisoformat(m["dates"][-1]) if m else None
+        l_mons = li.months(k)
+        days = (today - ld).days if ld else 999
+
+        # 智能化狀態判斷
+        if li.on_leave(k, curr_m): status = "🏖️ 請假中"
+        elif days > 60: status = "🔴 逾期 (2個月未出席)"
+        elif days > 45: status = "🟡 預警 (本月需出席)"
+        else: status = "🟢 活躍"
+
+        rep.append({
+            "姓名": name,
+            "最後出席": str(ld) if ld else "無出席紀錄",
+            "缺席天數": days if ld else "N/A",
+            "累計出席": len(m["dates"]) if m else 0,
+            "請假月份": ", ".join(l_mons) if l_mons else "無",
+            "累計請假月數": len(l_mons),
+            "狀態": status
+        })
+    return rep
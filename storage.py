@@ -0,0 +1,452 @@
+import json
+import copy
+import random
+import sqlite3
+import threading
+import time
+
+import codec
+
+# ==========================================
+# 儲存層：app.py 的 load_data / save_data 只透過這裡讀寫
+#   - SheetStorage : Google Sheets 正規化 (一列一筆報名 / 一列一筆請假 / 場次索引)
+#   - SQLiteStorage: 本機開發與測試用
+#   - BlobStorage  : 舊版 A1 單格 JSON (僅供遷移)
+# 三者都用同一份 dict 格式：{"sessions": {日期: [球員]}, "hidden": [日期], "leaves": {姓名: [月份]}, "stats": 出席統計 (見 stats.py)}
+# 每次存檔版本號 +1 (Sheets 放在 meta!A2)，SnapshotCache 只比對版本號決定要不要重讀
+# 過期場次會整場搬到按月分的歸檔區 (Sheets 每月一張 archive_YYYYMM，SQLite 的 archive 表)，平常的 load 不會讀到
+# 歸檔每場一格，用 codec.py 的精簡格式 (舊的 json 照樣讀得出來)
+# ==========================================
+SESSION_COLS = ["date", "hidden"]
+PLAYER_COLS = ["id", "date", "name", "count", "isMember", "bringBall", "occupyCourt", "timestamp", "extra"]
+LEAVE_COLS = ["name", "month"]
+STATS_COLS = ["key", "name", "dates"]
+KV_COLS = ["key", "value"]
+TABS = {"sessions": SESSION_COLS, "players": PLAYER_COLS, "leaves": LEAVE_COLS, "stats": STATS_COLS, "kv": KV_COLS}
+_P_FIELDS = ["id", "name", "count", "isMember", "bringBall", "occupyCourt", "timestamp"]
+
+
+class Conflict(Exception):
+    # 存檔時發現別人已經先寫入 (版本號對不上)
+    pass
+
+
+class StorageUnavailable(Exception):
+    # 暫時讀寫不到 (配額用完、Google 當機、重試都失敗)；跟「資料是空的」不同，呼叫端不能當成空資料處理
+    pass
+
+
+def empty_data():
+    return {"sessions": {}, "hidden": [], "leaves": {}, "stats": {"through": "", "members": {}}}
+
+
+def normalize(data):
+    if not isinstance(data, dict): return empty_data()
+    if "leaves" not in data: data["leaves"] = {}
+    if "sessions" not in data: data["sessions"] = {}
+    if "hidden" not in data: data["hidden"] = []
+    if "stats" not in data: data["stats"] = {"through": "", "members": {}}
+    return data
+
+
+def _b(v): return "1" if v else ""
+
+
+def flatten(data):
+    # dict -> {tab: {主鍵: 一列字串}}，存檔時拿新舊兩份比對，只寫有變動的列
+    hidden = set(data.get("hidden", []))
+    rows = {t: {} for t in TABS}
+    for d, pl in data["sessions"].items():
+        rows["sessions"][d] = [d, _b(d in hidden)]
+        for p in pl:
+            extra = {k: v for k, v in p.items() if k not in _P_FIELDS}
+            rows["players"][p["id"]] = [p["id"], d, p["name"], str(p.get("count", 1)), _b(p.get("isMember")),
+                                        _b(p.get("bringBall")), _b(p.get("occupyCourt")), repr(float(p.get("timestamp", 0))),
+                                        json.dumps(extra, ensure_ascii=False) if extra else ""]
+    for n, mons in data["leaves"].items():
+        for m in mons: rows["leaves"][(n, m)] = [n, m]
+    st = data.get("stats") or {"through": "", "members": {}}
+    for k, m in st["members"].items(): rows["stats"][k] = [k, m["name"], ",".join(m["dates"])]
+    if st["through"]: rows["kv"]["stats_through"] = ["stats_through", st["through"]]
+    return rows
+
+
+def unflatten(rows):
+    data = empty_data()
+    for d, r in rows["sessions"].items():
+        data["sessions"][d] = []
+        if r[1]: data["hidden"].append(d)
+    for r in rows["players"].values():
+        p = {"id": r[0], "name": r[2], "count": int(r[3] or 1), "isMember": bool(r[4]),
+             "bringBall": bool(r[5]), "occupyCourt": bool(r[6]), "timestamp": float(r[7] or 0)}
+        if r[8]: p.update(json.loads(r[8]))
+        data["sessions"].setdefault(r[1], []).append(p)
+    for (n, m) in rows["leaves"]:
+        data["leaves"].setdefault(n, []).append(m)
+    for k, r in rows["stats"].items():
+        data["stats"]["members"][k] = {"name": r[1], "dates": r[2].split(",") if r[2] else []}
+    data["stats"]["through"] = rows["kv"].get("stats_through", ["", ""])[1]
+    return data
+
+
+def _key(tab, r):
+    return (r[0], r[1]) if tab == "leaves" else r[0]
+
+
+class Storage:
+    ver = 0  # 最近一次 load / save 對應的版本號
+
+    def load(self): raise NotImplementedError
+    def save(self, data, expect=None): raise NotImplementedError  # expect: 版本號不符就丟 Conflict
+    def version(self): raise NotImplementedError
+    def archive(self, data, moved, expect=None): raise NotImplementedError  # moved: {日期: [球員]}，data 是搬走後的資料
+    def archive_months(self): return []
+    def load_archive(self, month): return {}
+
+    def load_all_archives(self):
+        out = {}
+        for m in self.archive_months(): out.update(self.load_archive(m))
+        return out
+
+
+class SheetStorage(Storage):
+    # 每個 tab 一張工作表，第 1 列是標題；刪除只清空該列，之後新增優先填回空列
+    # prefix：同一份試算表放好幾個團時，每個團的工作表名稱加上前綴 (例如 "g2_sessions")，各自有自己的 meta 版本號
+    def __init__(self, spreadsheet, prefix=""):
+        self.ss = spreadsheet
+        self.p = prefix
+        self.lock = threading.Lock()
+        have = {ws.title: ws for ws in spreadsheet.worksheets()}
+        self._grid = {}
+        for t, cols in TABS.items():
+            ws = have.get(self._t(t))
+            if ws is None:
+                ws = spreadsheet.add_worksheet(title=self._t(t), rows=200, cols=len(cols))
+                spreadsheet.values_update(f"{self._t(t)}!A1", params={"valueInputOption": "RAW"}, body={"values": [cols]})
+            self._grid[t] = [ws.id, ws.row_count]  # 工作表 id、目前列數 (加列後自己更新，不再問 Sheets)
+        if self._t("meta") not in have:
+            spreadsheet.add_worksheet(title=self._t("meta"), rows=10, cols=2)
+            spreadsheet.values_update(f"{self._t('meta')}!A1", params={"valueInputOption": "RAW"}, body={"values": [["version"], ["0"]]})
+        a = self._t("archive_")
+        self._arch = {f"{t[len(a):len(a) + 4]}-{t[len(a) + 4:]}": t for t in have if t.startswith(a)}
+        self._arch_cache = {}
+        self._snap = None
+
+    def _reset(self, snap, pos, free, end):
+        self._snap, self._pos, self._free, self._end = snap, pos, free, end
+
+    def _t(self, t):
+        return self.p + t
+
+    def _range(self, t, r):
+        return f"{self._t(t)}!A{r}:{chr(64 + len(TABS[t]))}{r}"
+
+    def load(self):
+        with self.lock: return self._load()
+
+    def version(self):
+        v = self.ss.values_get(f"{self._t('meta')}!A2").get("values")
+        return int(v[0][0]) if v else 0
+
+    def _load(self):
+        res = self.ss.values_batch_get([f"{self._t(t)}!A2:{chr(64 + len(c))}" for t, c in TABS.items()] + [f"{self._t('meta')}!A2"])
+        vrs = res.get("valueRanges", [])
+        if len(vrs) != len(TABS) + 1: raise StorageUnavailable("讀取結果不完整")
+        v = vrs[-1].get("values")
+        self.ver = int(v[0][0]) if v else 0
+        snap, pos, free, end = {}, {}, {}, {}
+        for t, vr in zip(TABS, vrs):
+            n = len(TABS[t])
+            snap[t], pos[t], free[t] = {}, {}, []
+            vals = vr.get("values", [])
+            for i, r in enumerate(vals):
+                r = (list(r) + [""] * n)[:n]
+                k = _key(t, r) if r[0] else None
+                if k is None or k in snap[t]: free[t].append(i + 2); continue
+                snap[t][k] = r; pos[t][k] = i + 2
+            end[t] = len(vals) + 1
+        self._reset(snap, pos, free, end)
+        return unflatten(snap)
+
+    def save(self, data, expect=None):
+        with self.lock:
+            if expect is not None and self.version() != expect: raise Conflict()
+            try: self._save(data)
+            except Exception:
+                self._snap = None  # 列位置可能已經改動，下次存檔前重讀
+                raise
+
+    def archive_months(self):
+        return sorted(self._arch)
+
+    def load_archive(self, month):
+        if month not in self._arch: return {}
+        if month not in self._arch_cache:
+            vals = self.ss.values_get(f"{self._arch[month]}!A1:B").get("values", [])
+            self._arch_cache[month] = {r[0]: codec.decode_players(r[1]) for r in vals if len(r) > 1}
+        return self._arch_cache[month]
+
+    def archive(self, data, moved, expect=None):
+        with self.lock:
+            if expect is not None and self.version() != expect: raise Conflict()
+            try:
+                by_m = {}
+                for d in sorted(moved): by_m.setdefault(d[:7], []).append([d, codec.encode_players(moved[d])])
+                for m, rows in by_m.items():
+                    if m not in self._arch:
+                        self._arch[m] = self._t("archive_" + m.replace("-", ""))
+                        self.ss.add_worksheet(title=self._arch[m], rows=40, cols=2)
+                    self.ss.values_append(f"{self._arch[m]}!A1", params={"valueInputOption": "RAW", "insertDataOption": "INSERT_ROWS"}, body={"values": rows})
+                    self._arch_cache.pop(m, None)
+                self._rewrite(data)
+            except Exception:
+                self._snap = None
+                raise
+
+    def _grow(self, t, rows):
+        # 列數不夠時加列：走試算表的 batch_update (跟其他呼叫一樣經過限流 / 重試)，不直接呼叫工作表的 add_rows
+        sid, have = self._grid[t]
+        if rows <= have: return
+        n = rows - have + 100
+        self.ss.batch_update({"requests": [{"appendDimension": {"sheetId": sid, "dimension": "ROWS", "length": n}}]})
+        self._grid[t][1] = have + n
+
+    def _rewrite(self, data):
+        # 整份重寫成連續的列，順便把之前刪除留下的空列收掉 (只在歸檔這種少見的時候做)
+        if self._snap is None: self._load()
+        new = flatten(data)
+        body = []
+        for t, cols in TABS.items():
+            rows = list(new[t].values())
+            vals = rows + [[""] * len(cols)] * max(0, self._end[t] - 1 - len(rows))
+            self._grow(t, len(vals) + 1)
+            if vals: body.append({"range": f"{self._t(t)}!A2:{chr(64 + len(cols))}{len(vals) + 1}", "values": vals})
+            self._pos[t] = {k: i + 2 for i, k in enumerate(new[t])}
+            self._free[t] = []
+            self._end[t] = len(rows) + 1
+        body.append({"range": f"{self._t('meta')}!A2", "values": [[str(self.ver + 1)]]})
+        self.ss.values_batch_update({"valueInputOption": "RAW", "data": body})
+        self._snap = new
+        self.ver += 1
+
+    def _save(self, data):
+        if self._snap is None: self._load()
+        new = flatten(data)
+        writes = {}
+        for t in TABS:
+            old, pos, free = self._snap[t], self._pos[t], self._free[t]
+            blank = [""] * len(TABS[t])
+            for k in [k for k in old if k not in new[t]]:
+                r = pos.pop(k); free.append(r); writes[(t, r)] = blank
+            free.sort()
+            for k, row in new[t].items():
+                if k in pos:
+                    if old[k] != row: writes[(t, pos[k])] = row
+                    continue
+                if free: r = free.pop(0)
+                else: self._end[t] += 1; r = self._end[t]
+                pos[k] = r; writes[(t, r)] = row
+            self._grow(t, self._end[t])
+        body = [{"range": self._range(t, r), "values": [v]} for (t, r), v in writes.items()]
+        body.append({"range": f"{self._t('meta')}!A2", "values": [[str(self.ver + 1)]]})
+        self.ss.values_batch_update({"valueInputOption": "RAW", "data": body})
+        self._snap = new
+        self.ver += 1
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.db:
+            for t, cols in TABS.items():
+                pk = "name, month" if t == "leaves" else cols[0]
+                self.db.execute(f"CREATE TABLE IF NOT EXISTS {t} ({', '.join(c + ' TEXT' for c in cols)}, PRIMARY KEY ({pk}))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS archive (date TEXT PRIMARY KEY, month TEXT, players TEXT)")
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('version', '0')")
+        self._snap = None
+
+    def _where(self, t):
+        return "name = ? AND month = ?" if t == "leaves" else f"{TABS[t][0]} = ?"
+
+    def version(self):
+        with self.lock: return self._version()
+
+    def _version(self):
+        return int(self.db.execute("SELECT v FROM meta WHERE k = 'version'").fetchone()[0])
+
+    def load(self):
+        with self.lock: return self._load()
+
+    def _load(self):
+        self.ver = self._version()
+        snap = {}
+        for t in TABS:
+            cur = self.db.execute(f"SELECT {', '.join(TABS[t])} FROM {t} ORDER BY rowid")
+            snap[t] = {_key(t, r): list(r) for r in cur}
+        self._snap = snap
+        return unflatten(snap)
+
+    def archive_months(self):
+        with self.lock: return [r[0] for r in self.db.execute("SELECT DISTINCT month FROM archive ORDER BY month")]
+
+    def load_archive(self, month):
+        with self.lock:
+            return {d: codec.decode_players(pl) for d, pl in self.db.execute("SELECT date, players FROM archive WHERE month = ? ORDER BY date", (month,))}
+
+    def archive(self, data, moved, expect=None):
+        rows = [(d, d[:7], codec.encode_players(pl)) for d, pl in moved.items()]
+        with self.lock:
+            self._save(data, expect, lambda: self.db.executemany("INSERT OR REPLACE INTO archive VALUES (?, ?, ?)", rows))
+
+    def save(self, data, expect=None):
+        with self.lock: self._save(data, expect)
+
+    def _save(self, data, expect, extra=None):
+        if self._snap is None: self._load()
+        new = flatten(data)
+        with self.db:
+            if extra: extra()
+            if expect is None: base = self._version()
+            elif self.db.execute("UPDATE meta SET v = ? WHERE k = 'version' AND v = ?", (str(expect + 1), str(expect))).rowcount == 0:
+                raise Conflict()
+            else: base = expect
+            for t, cols in TABS.items():
+                old = self._snap[t]
+                for k in [k for k in old if k not in new[t]]:
+                    self.db.execute(f"DELETE FROM {t} WHERE {self._where(t)}", k if t == "leaves" else (k,))
+                for k, row in new[t].items():
+                    if k not in old:
+                        self.db.execute(f"INSERT INTO {t} VALUES ({', '.join('?' * len(cols))})", row)
+                    elif old[k] != row:
+                        sets = ", ".join(f"{c} = ?" for c in cols)
+                        self.db.execute(f"UPDATE {t} SET {sets} WHERE {self._where(t)}", row + (list(k) if t == "leaves" else [k]))
+            if expect is None: self.db.execute("UPDATE meta SET v = ? WHERE k = 'version'", (str(base + 1),))
+        self._snap = new
+        self.ver = base + 1
+
+
+class BlobStorage(Storage):
+    # 舊格式：整份資料放在 sheet1 (第一張工作表) 的 A1；讀得懂最早的 json.dumps，寫入改用 codec 的壓縮格式 (單格上限 5 萬字)
+    # 跟 SheetStorage 一樣只用試算表層的 values_get / values_update，才會經過限流與重試
+    def __init__(self, spreadsheet):
+        self.ss = spreadsheet
+        self.a1 = "'{}'!A1".format(spreadsheet.worksheets()[0].title.replace("'", "''"))
+
+    def load(self):
+        vals = self.ss.values_get(self.a1).get("values")
+        s = vals[0][0] if vals and vals[0] else ""
+        return normalize(codec.decode_data(s)) if s else empty_data()
+
+    def save(self, data, expect=None):
+        self.ss.values_update(self.a1, params={"valueInputOption": "RAW"}, body={"values": [[codec.encode_data(data)]]})
+
+
+class SnapshotCache:
+    # 全程序共用一份快照：所有瀏覽器分頁的 rerun 都讀這份，
+    # 版本號最多每 check_every 秒查一次 (一格的小讀取)，有變才整份重讀；本程序存檔時直接換成新資料
+    # self.lock 只串起碰到儲存層的動作 (查版本 / 重讀 / commit / archive)；讀者拿快照不用等鎖，
+    # 有人正在讀寫 Sheets (可能卡在限流或重試好幾秒) 時直接回手上的快照，換新快照是單純的屬性指派
+    def __init__(self, db, check_every=1.0, stale_retry=10.0):
+        self.db = db
+        self.check_every = check_every
+        self.stale_retry = stale_retry
+        self.lock = threading.Lock()
+        self.data = None
+        self.checked = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stale = False  # 最近一次查版本 / 重讀失敗，手上的是舊快照
+
+    def _swap(self, data):
+        self.data, self.checked = data, time.monotonic()
+        return data
+
+    def get(self):
+        # 讀不到時 (StorageUnavailable) 有舊快照就先回舊的並標記 stale，一份都沒有才往外丟
+        data = self.data
+        if data is not None and time.monotonic() - self.checked < self.check_every:
+            self.hits += 1
+            return data
+        if not self.lock.acquire(blocking=data is None):
+            self.hits += 1  # 別人正在查 / 寫，先用手上的
+            return data
+        try:
+            data = self.data
+            now = time.monotonic()
+            if data is not None and now - self.checked < self.check_every: self.hits += 1; return data
+            try:
+                if data is not None:
+                    v = self.db.version()
+                    self.checked, self.stale = now, False
+                    if v == self.db.ver: self.hits += 1; return data
+                self.misses += 1
+                data = self._swap(self.db.load())
+            except StorageUnavailable:
+                if data is None: raise
+                # 重試已經花了好幾秒，接下來 stale_retry 秒內直接用舊快照，不要每個 rerun 都再卡一次
+                self.checked, self.stale = time.monotonic() + self.stale_retry, True
+                return data
+            self.stale = False
+            return data
+        finally:
+            self.lock.release()
+
+    def commit(self, muts, apply_all, retries=5):
+        # 樂觀鎖：在最新快照上用 apply_all(data, muts) 套用整批 (回傳每筆結果，被拒的是例外物件)，
+        # 帶版本號存檔；撞到別人先寫就重讀後整批重放
+        # 同一程序內的寫入由 self.lock 串起來，只有跨程序才會真的衝突；存檔期間讀者照樣拿舊快照
+        for attempt in range(retries):
+            with self.lock:
+                base = self.data if self.data is not None and not attempt else self._swap(self.db.load())
+                data = copy.deepcopy(base)
+                results = apply_all(data, muts)
+                if all(isinstance(r, Exception) for r in results): return results
+                try: self.db.save(data, expect=self.db.ver)
+                except Conflict: pass
+                else:
+                    self._swap(data)
+                    return results
+            time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+        raise Conflict()
+
+    def archive(self, before, settle, retries=5):
+        # 把 before 之前的場次整場搬進歸檔；settle(data) 先在搬走前處理要保留的東西 (例如把出席結算進統計)
+        for attempt in range(retries):
+            with self.lock:
+                base = self.data if self.data is not None and not attempt else self._swap(self.db.load())
+                dates = sorted(d for d in base["sessions"] if d < before)
+                if not dates: return []
+                data = copy.deepcopy(base)
+                settle(data)
+                moved = {d: data["sessions"].pop(d) for d in dates}
+                data["hidden"] = [d for d in data["hidden"] if d not in moved]
+                try: self.db.archive(data, moved, expect=self.db.ver)
+                except Conflict: pass
+                else:
+                    self._swap(data)
+                    return dates
+            time.sleep(random.uniform(0.05, 0.2) * (attempt + 1))
+        raise Conflict()
+
+    def version(self):
+        # 心跳用：照 check_every 節流查版本號 (有變才重讀)，回傳目前快照的版本
+        self.get()
+        return self.db.ver
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "version": self.db.ver,
+                "stale": self.stale}
+
+
+def migrate(src, cache, plan, apply_all):
+    # 把舊格式 (A1) 補進新後端，可重複執行：plan(目前資料, 舊資料) 只產生「新增沒有的」異動 (見 bulk.import_ops)，
+    # 包成一筆 bulk 經 cache.commit 帶版本號寫入，不刪也不覆蓋新後端已有的報名與統計；A1 是空的就拒絕
+    old = src.load()
+    if not old["sessions"] and not old["leaves"]: raise ValueError("舊格式 A1 沒有資料，不遷移")
+    # 回傳 (舊資料, 異動, 各筆結果)
+    muts = plan(cache.get(), old)
+    if not muts: return old, [], []
+    return old, muts, cache.commit([{"op": "bulk", "muts": muts}], apply_all)[0]
@@ -0,0 +1,86 @@
+import json
+import uuid
+
+import pytest
+
+import codec
+
+# 各種邊角：本來就 ~ 開頭的 id、非 UUID 的舊 id、count 不是 0/1、加油團、多的欄位、owner 指到場外 / 空字串 / 沒有 owner
+EDGE = [{"id": "~odd", "name": "Amy", "count": 1, "isMember": True, "bringBall": False, "occupyCourt": True, "timestamp": 5.5, "owner": "~odd"},
+        {"id": "legacy-1", "name": "Amy (友1)", "count": 2, "isMember": False, "bringBall": False, "occupyCourt": False, "timestamp": 1.25, "owner": ""},
+        {"id": str(uuid.UUID(int=7)), "name": "Bob之友", "count": 0, "isMember": False, "bringBall": True, "occupyCourt": False, "timestamp": 1760000000.123456, "note": "x"},
+        {"id": "x", "name": "", "count": 1, "isMember": False, "bringBall": False, "occupyCourt": False, "timestamp": 0.0, "owner": "nobody"}]
+
+
+def roster(n=25):
+    out = []
+    for i in range(n):
+        pid = str(uuid.UUID(int=1000 + i)) if i % 2 else codec.new_id()
+        owner = out[i - 1]["id"] if i % 5 == 4 else pid
+        out.append({"id": pid, "name": f"團員{i:03d}" + (" (友1)" if owner != pid else ""), "count": 0 if i % 7 == 3 else 1,
+                    "isMember": owner == pid, "bringBall": i % 3 == 0, "occupyCourt": i % 4 == 0,
+                    "timestamp": 1760000000 + i * 1.37, "owner": owner})
+    return out
+
+
+def data():
+    return {"sessions": {"2026-10-04": roster(), "2026-10-11": EDGE, "2026-10-18": []}, "hidden": ["2026-10-18"],
+            "leaves": {"Amy": ["2026-11"], "ｂｏｂ": ["2026-11", "2026-12"]},
+            "stats": {"through": "2026-10-11", "members": {"amy": {"name": "Amy", "dates": ["2026-10-11"]}}}}
+
+
+@pytest.mark.parametrize("players", [EDGE, roster(), []], ids=["edge", "roster", "empty"])
+@pytest.mark.parametrize("compress", [False, True], ids=["j1", "z1"])
+def test_players_round_trip(players, compress):
+    s = codec.encode_players(players, compress)
+    assert s.startswith(f"{'z' if compress else 'j'}{codec.VERSION}:")
+    assert codec.decode_players(s) == codec.canonical(players)
+
+
+def test_canonical_keeps_microseconds():
+    got = codec.decode_players(codec.encode_players([dict(EDGE[2], timestamp=1760000000.1234567)]))
+    assert got[0]["timestamp"] == pytest.approx(1760000000.123457, abs=1e-6)
+
+
+@pytest.mark.parametrize("pid", [str(uuid.UUID(int=7)), "~odd", "~~x", "plain", codec.new_id()])
+def test_id_short_form_round_trips(pid):
+    assert codec._long(codec._short(pid)) == pid
+
+
+def test_uuid_ids_are_shortened():
+    assert len(codec._short(str(uuid.uuid4()))) == 23
+
+
+def test_new_id():
+    ids = {codec.new_id() for _ in range(1000)}
+    assert len(ids) == 1000 and all(len(i) == 12 and "=" not in i for i in ids)
+
+
+def test_legacy_json_players():
+    old = json.dumps(EDGE, ensure_ascii=False)
+    assert codec.decode_players(old) == EDGE
+
+
+@pytest.mark.parametrize("compress", [False, True], ids=["j1", "z1"])
+def test_data_round_trip(compress):
+    d = data()
+    back = codec.decode_data(codec.encode_data(d, compress))
+    assert back["sessions"] == {k: codec.canonical(pl) for k, pl in d["sessions"].items()}
+    for k in ("hidden", "leaves", "stats"): assert back[k] == d[k]
+
+
+def test_data_without_stats():
+    d = data()
+    del d["stats"]
+    assert "stats" not in codec.decode_data(codec.encode_data(d))
+
+
+def test_legacy_json_data():
+    d = data()
+    assert codec.decode_data(json.dumps(d, ensure_ascii=False)) == d
+
+
+@pytest.mark.parametrize("s", [f"j{codec.VERSION + 1}:[]", "q1:[]"])
+def test_unknown_or_newer_format_rejected(s):
+    with pytest.raises(ValueError):
+        codec.decode_players(s)
@@ -0,0 +1,106 @@
+import copy
+import random
+
+import pytest
+
+import roster
+
+
+# 對照組：改成 RosterEngine 之前 app 的算法，每次整份依 timestamp 排序，名額還夠就進正選 (加油團 count 0 不佔名額)
+def baseline(players, cap):
+    main, wait, curr = [], [], 0
+    for p in sorted(players, key=lambda x: (x.get('timestamp', 0), x['id'])):
+        if curr + p.get('count', 1) <= cap: main.append(p); curr += p.get('count', 1)
+        else: wait.append(p)
+    cand = next((p for p in reversed(main) if roster.is_friend(p) and p.get('count', 1) > 0), None)
+    return {"main": [p['id'] for p in main], "wait": [p['id'] for p in wait], "main_count": curr, "wait_count": len(wait),
+            "balls": sum(1 for p in main if p.get('bringBall')), "courts": sum(1 for p in main if p.get('occupyCourt')),
+            "candidate": cand and cand['id']}
+
+
+def engine(eng):
+    cand = eng.promotion_candidate()
+    return {"main": [p['id'] for p in eng.main()], "wait": [p['id'] for p in eng.wait()], "main_count": eng.main_count,
+            "wait_count": eng.wait_count, "balls": eng.balls, "courts": eng.courts, "candidate": cand and cand['id']}
+
+
+def player(rng, pid, members):
+    # 跟 mutations.add_regs 一樣：朋友 owner 指向團員、一律佔名額、不帶球佔場；團員才可能是加油團
+    if members and rng.random() < 0.3:
+        return {"id": pid, "name": f"{pid} (友1)", "count": 1, "isMember": False, "bringBall": False, "occupyCourt": False,
+                "timestamp": rng.uniform(0, 1000), "owner": rng.choice(members)}
+    return {"id": pid, "name": pid, "count": 0 if rng.random() < 0.15 else 1, "isMember": True, "bringBall": rng.random() < 0.3,
+            "occupyCourt": rng.random() < 0.2, "timestamp": rng.uniform(0, 1000), "owner": pid}
+
+
+def steps(rng, n):
+    # 隨機的增 / 刪 / 改 (改 timestamp 等於遞補時的換位)，每一步之後回傳當下的名單
+    players, k = [], 0
+    for _ in range(n):
+        r = rng.random()
+        if r < 0.55 or not players:
+            k += 1
+            players.append(player(rng, f"p{k:03d}", [p['id'] for p in players if not roster.is_friend(p)]))
+        elif r < 0.8:
+            players.pop(rng.randrange(len(players)))
+        else:
+            p = rng.choice(players)
+            p.update(timestamp=rng.uniform(0, 1000), bringBall=not p['bringBall'] and p['owner'] == p['id'])
+        yield players
+
+
+@pytest.mark.parametrize("cap", [1, 3, 20])
+@pytest.mark.parametrize("seed", range(20))
+def test_engine_matches_baseline(seed, cap):
+    rng, eng, seen = random.Random(seed), roster.RosterEngine(cap), {}
+    for players in steps(rng, 80):
+        now = {p['id']: p for p in players}
+        for pid in [x for x in seen if x not in now]: eng.remove(pid)
+        for pid, p in now.items():
+            if pid not in seen: eng.add(dict(p))
+            elif seen[pid] != p: eng.update(dict(p))
+        seen = copy.deepcopy(now)
+        want = baseline(players, cap)
+        assert engine(eng) == want
+        assert all(eng.is_main(pid) == (pid in want["main"]) for pid in now)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_cache_sync_matches_baseline(seed):
+    # RosterCache 每次拿到的都是新的一份名單 (快照換新)，只同步有變的人
+    rng, rc = random.Random(seed), roster.RosterCache(5)
+    for players in steps(rng, 80):
+        snap = copy.deepcopy(players)
+        v = rc.get("2026-11-01", snap)
+        want = baseline(snap, 5)
+        assert [p['id'] for p in v.main] == want["main"] and [p['id'] for p in v.wait] == want["wait"]
+        assert (v.main_count, v.wait_count, v.balls, v.courts) == (want["main_count"], want["wait_count"], want["balls"], want["courts"])
+        assert (v.candidate and v.candidate['id']) == want["candidate"]
+
+
+def test_fresh_engine_matches_baseline():
+    rng = random.Random(7)
+    for players in steps(rng, 60):
+        assert engine(roster.RosterEngine(4, copy.deepcopy(players))) == baseline(players, 4)
+
+
+def test_cutoff_is_last_main_timestamp():
+    rng = random.Random(3)
+    for players in steps(rng, 60):
+        eng = roster.RosterEngine(4, players)
+        assert eng.cutoff() == max((p['timestamp'] for p in eng.main()), default=None)
+
+
+def test_cheer_never_takes_a_spot():
+    cheer = [{"id": f"c{i}", "name": f"c{i}", "count": 0, "bringBall": True, "timestamp": i, "owner": f"c{i}"} for i in range(5)]
+    eng = roster.RosterEngine(2, cheer + [{"id": "a", "name": "a", "timestamp": 9, "owner": "a"}])
+    assert (eng.main_count, eng.wait_count, eng.balls, len(eng.main())) == (1, 0, 5, 6)
+    assert eng.promotion_candidate() is None
+
+
+def test_view_is_not_changed_by_later_sync():
+    rc = roster.RosterCache(1)
+    a = {"id": "a", "name": "a", "timestamp": 1, "owner": "a"}
+    v = rc.get("d", [a])
+    rc.get("d", [dict(a, timestamp=5), {"id": "b", "name": "b", "timestamp": 2, "owner": "b"}])
+    assert [p['id'] for p in v.main] == ["a"] and v.wait == [] and v.main_count == 1
@@ -0,0 +1,101 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import metrics
+from storage import Conflict, StorageUnavailable
+
+# ==========================================
+# 寫入佇列：所有分頁送出的異動先寫進本機 journal，再交給背景執行緒，
+# 每 window 秒把累積的異動合成一次 commit (一次讀 + 一次寫)，完成後透過 Future 通知呼叫端。
+# 程式重啟時 journal 裡還沒完成的異動會自動重放。
+# Sheets 暫時寫不進去 (StorageUnavailable / 一直版本衝突) 時不標 done，整批留著退避後再試，呼叫端的 Future 繼續等。
+# ==========================================
+class WriteBehind:
+    def __init__(self, cache, apply_all, journal_path=None, window=0.3, retry_base=1.0, retry_cap=30.0):
+        self.cache = cache
+        self.apply_all = apply_all
+        self.journal_path = journal_path
+        self.window = window
+        self.retry_base, self.retry_cap = retry_base, retry_cap
+        self.failures = 0  # 連續寫入失敗次數
+        self.q = queue.Queue()
+        self.jlock = threading.Lock()
+        self.pending = 0
+        self.flushes = 0
+        self.applied = 0
+        self._recover()
+        threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def submit(self, m):
+        mid = uuid.uuid4().hex
+        fut = Future()
+        with self.jlock:
+            self._journal({"id": mid, "m": m})
+            self.pending += 1
+        self.q.put((mid, m, fut))
+        return fut
+
+    def stats(self):
+        return {"flushes": self.flushes, "mutations": self.applied, "queued": self.q.qsize(),
+                "per_flush": self.applied / self.flushes if self.flushes else 0.0, "retrying": self.failures}
+
+    def _journal(self, rec):
+        if not self.journal_path: return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self):
+        if not self.journal_path or not os.path.exists(self.journal_path): return
+        todo, done = {}, set()
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try: rec = json.loads(line)
+                except ValueError: continue  # 寫到一半就當掉的最後一行
+                if "done" in rec: done.add(rec["done"])
+                else: todo[rec["id"]] = rec["m"]
+        todo = {k: v for k, v in todo.items() if k not in done}
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            for mid, m in todo.items(): f.write(json.dumps({"id": mid, "m": m}, ensure_ascii=False) + "\n")
+        for mid, m in todo.items():
+            self.pending += 1
+            self.q.put((mid, m, Future()))
+
+    def _run(self):
+        batch = []
+        while True:
+            if not batch: batch = [self.q.get()]
+            time.sleep(self.window)  # 等同一波的其他異動進來
+            while True:
+                try: batch.append(self.q.get_nowait())
+                except queue.Empty: break
+            metrics.begin_run("writer")
+            try:
+                with metrics.span("writer.commit", n=len(batch)):
+                    results = self.cache.commit([m for _, m, _ in batch], self.apply_all)
+            except (StorageUnavailable, Conflict):
+                # 沒寫進去：journal 不標 done (重啟也會重放)，這批連同之後進來的下一輪再試
+                self.failures += 1
+                metrics.count("writer.retries")
+                metrics.end_run()
+                time.sleep(min(self.retry_cap, self.retry_base * 2 ** (self.failures - 1)))
+                continue
+            except Exception as e: results = [e] * len(batch)
+            self.failures = 0
+            with self.jlock:
+                for mid, _, _ in batch: self._journal({"done": mid})
+                self.pending -= len(batch)
+                if self.pending == 0 and self.journal_path: open(self.journal_path, "w").close()
+            self.flushes += 1
+            self.applied += len(batch)
+            for (_, _, fut), r in zip(batch, results):
+                if isinstance(r, Exception): fut.set_exception(r)
+                else: fut.set_result(r)
+            batch = []
+            metrics.end_run()